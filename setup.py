@@ -9,9 +9,9 @@ setup(
     python_requires=">=3.8",
     install_requires=[
         'wxPython>=4.1',
-        'yangson>=1.4.9',
+        'numpy',
+        'yangson>=1.7,<1.8',
         'rstr>=2.2',
-        'PyPubSub>=4',
         'importlib_metadata>=4.8.1',
     ],
     packages = ["yanggui"],
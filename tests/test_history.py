@@ -0,0 +1,74 @@
+# Copyright 2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+import os
+
+import pytest
+import yangson
+
+from yanggui.dsrepo import DataStoreRepo
+
+YANG_DIR = os.path.join(os.path.dirname(__file__), 'yang')
+
+RAW = {
+    'revalidation:top': {
+        'interface': [{'name': 'eth{}'.format(i), 'mtu': 1500} for i in range(200)]
+    }
+}
+INTERFACES = ('revalidation:top', 'interface')
+
+@pytest.fixture
+def dm():
+    return yangson.DataModel.from_file(os.path.join(YANG_DIR, 'yang-library.json'), [YANG_DIR])
+
+def poll(repo, dm):
+    # Merges a freshly built copy of the interfaces, as returned by a southbound GET
+    base = repo.get_resource()
+    interfaces = dm.from_raw(RAW)['revalidation:top']['interface']
+    root = base['revalidation:top'].put_member('interface', interfaces.value).top()
+    repo.merge(root, [INTERFACES], base)
+
+def test_refresh_is_not_recorded(dm):
+    repo = DataStoreRepo(dm)
+    repo.load_raw(RAW)
+    repo.commit(repo.get_resource()['revalidation:top'].put_member('limit', 5).top())
+    repo.undo()
+    poll(repo, dm)
+    assert len(repo.undo_history) == 0
+    assert repo.can_redo()
+
+def test_refresh_charges_replaced_values(dm):
+    repo = DataStoreRepo(dm)
+    repo.load_raw(RAW)
+    repo.commit(repo.get_resource()['revalidation:top'].put_member('limit', 5).top())
+    cost = repo._history_cost
+    poll(repo, dm)
+    # The undo entry alone keeps the old interfaces, 200 entries of 3 values and the list
+    assert len(repo.undo_history) == 1
+    assert repo._history_cost == cost + 601
+    for idx in range(50):
+        poll(repo, dm)
+    assert repo._history_cost == cost + 601
+
+def test_refreshes_are_evicted(dm):
+    repo = DataStoreRepo(dm, history_budget=500)
+    repo.load_raw(RAW)
+    for limit in (5, 6):
+        repo.commit(repo.get_resource()['revalidation:top'].put_member('limit', limit).top())
+    poll(repo, dm)
+    assert repo._history_cost <= repo.history_budget
+    assert len(repo.undo_history) == 0
+
+def test_merge_is_not_recorded(dm):
+    repo = DataStoreRepo(dm)
+    repo.load_raw(RAW)
+    repo.commit(repo.get_resource()['revalidation:top'].put_member('limit', 5).top())
+    repo.commit(repo.get_resource()['revalidation:top'].put_member('limit', 6).top())
+    repo.undo()
+    base = repo.get_resource()
+    root = base['revalidation:top']['interface'][0]['mtu'].update(9000).top()
+    repo.merge(root, [INTERFACES + (0, 'mtu')], base)
+    assert len(repo.undo_history) == 1
+    assert repo.can_redo()
+    assert repo.get_resource(INTERFACES + (0, 'mtu')).value == 9000
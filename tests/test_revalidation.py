@@ -0,0 +1,112 @@
+# Copyright 2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+import os
+import random
+
+import pytest
+import yangson
+
+from yanggui.dsrepo import DataStoreRepo
+from yanggui.errorstore import ErrorStore
+
+YANG_DIR = os.path.join(os.path.dirname(__file__), 'yang')
+
+RAW = {
+    'revalidation:top': {
+        'enabled': True,
+        'limit': 10,
+        'gref': 't1',
+        'speed': 3,
+        'cond': {'v': 'a'},
+        'interface': [{'name': 'eth{}'.format(i), 'mtu': 1500} for i in range(5)],
+        'binding': [{'id': i, 'ifname': 'eth{}'.format(i)} for i in range(3)],
+        'peer': [{'id': i, 'when-leaf': 'q'} for i in range(3)]
+    }
+}
+
+@pytest.fixture
+def repo():
+    dm = yangson.DataModel.from_file(os.path.join(YANG_DIR, 'yang-library.json'), [YANG_DIR])
+    repo = DataStoreRepo(dm)
+    repo.load_raw(RAW)
+    return repo
+
+def error_keys(errors):
+    return sorted(set(errors.key(e) for e in errors))
+
+def full_validation(repo, root):
+    errors = ErrorStore()
+    repo.validator.validate(root, errors)
+    return error_keys(errors)
+
+def assert_errors(repo):
+    assert error_keys(repo.errorLog) == full_validation(repo, repo.get_resource())
+
+def test_when_of_changed_reference(repo):
+    top = repo.get_resource()['revalidation:top']
+    repo.commit(top.put_member('gref', 'x').top())
+    assert_errors(repo)
+    repo.commit(top.put_member('gref', 'y').top())
+    assert_errors(repo)
+    repo.commit(top.put_member('gref', 't1').top())
+    assert_errors(repo)
+
+def test_leafref_target_renamed(repo):
+    interface = repo.get_resource()['revalidation:top']['interface'][0]
+    repo.commit(interface.update({'name': 'eth9'}, raw=True).top())
+    assert_errors(repo)
+    assert len(repo.errorLog) > 0
+
+def test_must_of_removed_list(repo):
+    top = repo.get_resource()['revalidation:top']
+    repo.commit(top.delete_item('interface').top())
+    assert_errors(repo)
+    repo.commit(repo.get_resource()['revalidation:top'].put_member('interface', [{'name': 'eth0'}], raw=True).top())
+    assert_errors(repo)
+
+def random_edit(top, rnd):
+    op = rnd.randrange(13)
+    if op == 0:
+        interfaces = top['interface']
+        return interfaces[rnd.randrange(len(interfaces.value))]['mtu'].update(rnd.choice([20, 1500, 9000, 10000])).top()
+    elif op == 1:
+        return top['interface'][-1].insert_after({'name': 'eth{}'.format(rnd.randrange(20)), 'mtu': 1500}, raw=True).top()
+    elif op == 2:
+        interfaces = top['interface']
+        return interfaces.delete_item(rnd.randrange(len(interfaces.value))).top()
+    elif op == 3:
+        return top['binding'][-1].insert_after({'id': rnd.randrange(5), 'ifname': 'eth{}'.format(rnd.randrange(20))}, raw=True).top()
+    elif op == 4:
+        return top.put_member('limit', rnd.choice([0, 5, 60, 200])).top()
+    elif op == 5:
+        interfaces = top['interface']
+        return interfaces[rnd.randrange(len(interfaces.value))].update({'name': 'eth{}'.format(rnd.randrange(20))}, raw=True).top()
+    elif op == 6:
+        return top.delete_item('interface').top()
+    elif op == 7:
+        return top.put_member('interface', [{'name': 'eth0'}], raw=True).top()
+    elif op == 8:
+        return top.put_member('gref', rnd.choice(['x', 'y', 't1'])).top()
+    elif op == 9:
+        return top.put_member('enabled', rnd.choice([True, False])).top()
+    elif op == 10:
+        return top.put_member('speed', 4).top() if not 'speed' in top else top.delete_item('speed').top()
+    elif op == 11:
+        return top.put_member('cond', {'v': 'b'}, raw=True).top() if not 'cond' in top else top.delete_item('cond').top()
+    bindings = top['binding']
+    return bindings.delete_item(rnd.randrange(len(bindings.value))).top()
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_commits(repo, seed):
+    # Incremental revalidation after every commit finds the same errors as validating the whole tree
+    rnd = random.Random(seed)
+    for step in range(200):
+        top = repo.get_resource()['revalidation:top']
+        try:
+            root = random_edit(top, rnd)
+        except (yangson.exceptions.YangsonException, KeyError, IndexError, ValueError):
+            continue
+        repo.commit(root)
+        assert_errors(repo)
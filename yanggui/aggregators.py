@@ -0,0 +1,184 @@
+# Copyright 2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+import collections
+import heapq
+import math
+
+import yangson
+
+# Counters wrap around to 0 after their maximum value (RFC 6991)
+COUNTER_MODULE = 'ietf-yang-types'
+COUNTER_TYPES = {
+    'counter32': 2**32,
+    'zero-based-counter32': 2**32,
+    'counter64': 2**64,
+    'zero-based-counter64': 2**64
+}
+
+def counter_modulus(schema_node):
+    # The wrap-around modulus of a leaf whose type is derived from a counter type of
+    # ietf-yang-types, None for other leafs
+    dtype = getattr(schema_node, 'type', None)
+    name = getattr(dtype, 'name', None)
+    if name == None:
+        return None
+    sctx = dtype.sctx
+    module = sctx.schema_data.modules[sctx.text_mid]
+    # yangson keeps the name of the typedef but not the prefix it was used with, which is
+    # taken from the statements of the leaf in the module text. If that is ambiguous, the
+    # typedefs of the module itself hide imported ones of the same name.
+    arguments = set(_type_arguments(module.statement, schema_node.name, name))
+    if len(arguments) != 1:
+        arguments = [name] + sorted(prefix + ':' + name for prefix, mid in module.prefix_map.items()
+                                    if mid != module.main_module)
+    for argument in arguments:
+        stmt = yangson.statement.Statement('type', argument)
+        stmt.superstmt = module.statement
+        try:
+            tdef, tdef_sctx = sctx.schema_data.get_definition(stmt, sctx)
+        except (yangson.exceptions.DefinitionNotFound, yangson.exceptions.UnknownPrefix):
+            continue
+        return _derived_modulus(tdef, tdef_sctx)
+    return None
+
+def _type_arguments(stmt, leaf, name):
+    for sub in stmt.substatements:
+        if sub.keyword in ('leaf', 'leaf-list') and sub.argument == leaf:
+            dtype = sub.find1('type')
+            if dtype != None and dtype.argument.split(':')[-1] == name:
+                yield dtype.argument
+        else:
+            yield from _type_arguments(sub, leaf, name)
+
+def _derived_modulus(tdef, sctx):
+    # Follows the typedefs a type is derived from down to a built-in type
+    while True:
+        module = sctx.schema_data.modules[sctx.text_mid].main_module
+        if module[0] == COUNTER_MODULE and tdef.argument in COUNTER_TYPES:
+            return COUNTER_TYPES[tdef.argument]
+        stmt = tdef.find1('type', required=True)
+        if stmt.argument in yangson.datatype.DataType.dtypes:
+            return None
+        tdef, sctx = sctx.schema_data.get_definition(stmt, sctx)
+
+class RollingStatistics:
+    # Minimum, maximum, mean and a quantile of the samples within the last window seconds.
+    # Minimum and maximum are taken from monotonic queues and the mean from a running sum,
+    # in amortized O(1) per sample. For the quantile, the samples of the window are split
+    # into two heaps, the ceil(quantile * n) smallest ones in a max-heap and the others in
+    # a min-heap, in amortized O(log n) per sample. Evicted samples are only dropped from a
+    # heap when they reach its top, or when they make up half of it.
+    def __init__(self, window=60, quantile=0.95):
+        self.window = window
+        self.quantile = quantile
+        self.samples = collections.deque()  # (time, value, sequence number) within the window
+        self.minima = collections.deque()   # increasing values, candidates for the minimum
+        self.maxima = collections.deque()   # decreasing values, candidates for the maximum
+        self.lower = list()                 # max-heap of (-value, -sequence number)
+        self.upper = list()                 # min-heap of (value, sequence number)
+        self.sizes = [0, 0]                 # samples of the window in lower and upper
+        self.evicted = set()                # sequence numbers of evicted samples still in a heap
+        self.count = 0
+        self.sum = 0
+
+    def update(self, time, value):
+        seq = self.count
+        self.count += 1
+        self.samples.append((time, value, seq))
+        self.sum += value
+        if self.sizes[0] > 0 and (value, seq) < self._lower_top():
+            heapq.heappush(self.lower, (-value, -seq))
+            self.sizes[0] += 1
+        else:
+            heapq.heappush(self.upper, (value, seq))
+            self.sizes[1] += 1
+        while len(self.minima) > 0 and self.minima[-1] > value:
+            self.minima.pop()
+        self.minima.append(value)
+        while len(self.maxima) > 0 and self.maxima[-1] < value:
+            self.maxima.pop()
+        self.maxima.append(value)
+        while self.samples[0][0] <= time - self.window:
+            self._evict(*self.samples.popleft()[1:])
+        n = len(self.samples)
+        self._balance(max(1, math.ceil(self.quantile * n)))
+        return {
+            'min': self.minima[0],
+            'max': self.maxima[0],
+            'mean': self.sum / n,
+            'p{}'.format(round(self.quantile * 100)): self._lower_top()[0]
+        }
+
+    def _evict(self, value, seq):
+        self.sum -= value
+        if self.sizes[0] > 0 and (value, seq) <= self._lower_top():
+            self.sizes[0] -= 1
+        else:
+            self.sizes[1] -= 1
+        self.evicted.add(seq)
+        self._prune()
+        if self.minima[0] == value:
+            self.minima.popleft()
+        if self.maxima[0] == value:
+            self.maxima.popleft()
+
+    def _balance(self, k):
+        # Moves samples between the heaps until lower holds the k smallest ones
+        while self.sizes[0] > k:
+            value, seq = heapq.heappop(self.lower)
+            heapq.heappush(self.upper, (-value, -seq))
+            self.sizes = [self.sizes[0] - 1, self.sizes[1] + 1]
+            self._prune()
+        while self.sizes[0] < k and self.sizes[1] > 0:
+            value, seq = heapq.heappop(self.upper)
+            heapq.heappush(self.lower, (-value, -seq))
+            self.sizes = [self.sizes[0] + 1, self.sizes[1] - 1]
+            self._prune()
+
+    def _lower_top(self):
+        value, seq = self.lower[0]
+        return -value, -seq
+
+    def _prune(self):
+        for idx, heap in enumerate((self.lower, self.upper)):
+            if len(heap) > 2 * self.sizes[idx] + 16:
+                kept = list()
+                for item in heap:
+                    if abs(item[1]) in self.evicted:
+                        self.evicted.discard(abs(item[1]))
+                    else:
+                        kept.append(item)
+                heap[:] = kept
+                heapq.heapify(heap)
+            while len(heap) > 0 and abs(heap[0][1]) in self.evicted:
+                self.evicted.discard(abs(heapq.heappop(heap)[1]))
+
+class SeriesStatistics:
+    # Derives delta and rate from consecutive samples, and the rolling statistics of the
+    # rate for counters or of the value otherwise. A counter that decreased is assumed to
+    # have wrapped around once.
+    kinds = ('delta', 'rate', 'min', 'max', 'mean', 'p95')
+
+    def __init__(self, modulus=None, window=60):
+        self.modulus = modulus
+        self.rolling = RollingStatistics(window, quantile=0.95)
+        self.last = None
+
+    def is_counter(self):
+        return self.modulus != None
+
+    def update(self, time, value):
+        results = dict()
+        last, self.last = self.last, (time, value)
+        if last != None and time > last[0]:
+            delta = value - last[1]
+            if delta < 0 and self.modulus != None:
+                delta += self.modulus
+            results['delta'] = delta
+            results['rate'] = delta / (time - last[0])
+        base = results.get('rate') if self.modulus != None else value
+        if base != None:
+            results.update(self.rolling.update(time, base))
+        return results
@@ -0,0 +1,120 @@
+# Copyright 2020-2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+import concurrent.futures
+
+import wx
+
+class SouthBoundTimeout(Exception):
+    pass
+
+class SouthBoundRequest:
+    def __init__(self, name, done, failed):
+        self.name = name
+        self.done = done
+        self.failed = failed
+        self.future = None
+        self.timer = None
+        self.finished = False   # only accessed on the GUI thread
+
+    def cancel(self):
+        # The result of a request that is already running is discarded
+        if not self.finished:
+            self._finish()
+            self.future.cancel()
+
+    def is_pending(self):
+        return not self.finished
+
+    def in_flight(self):
+        # The call is queued or still running, even if its result is no longer awaited because
+        # it timed out or was cancelled
+        return not self.future.done()
+
+    def _finish(self):
+        self.finished = True
+        if self.timer != None:
+            self.timer.Stop()
+
+class AsyncSouthBoundIf:
+    # Runs the calls of a SouthBoundIf on a thread pool, so that slow devices do not block
+    # the GUI. Results are handed back on the GUI thread, where retrieved data is merged
+    # into the datastore with a single commit. Requests time out after timeout seconds.
+    # The calls run on up to max_workers threads at once, by default as many as the
+    # interface declares to be safe, i.e. one unless it says otherwise.
+    def __init__(self, sbif, max_workers=None, timeout=10.0):
+        self.sbif = sbif
+        self.timeout = timeout
+        if max_workers == None:
+            max_workers = getattr(sbif, 'max_workers', 1)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='southbound')
+
+    def get(self, dsrepo, paths, done=None, failed=None, timeout=None):
+        # done(changes) is called with the changes committed to the datastore
+        base = dsrepo.get_resource()
+        def run():
+            return self.sbif.get_many(dsrepo.dm, base, paths)
+        def merge(root):
+            changes = None
+            if root != None:
+                changes = dsrepo.merge(root, paths, base)
+            if done != None:
+                done(changes)
+        return self._submit('GET {}'.format(_paths_name(paths)), run, merge, failed, timeout)
+
+    def put(self, dsrepo, paths, done=None, failed=None, timeout=None):
+        data = [dsrepo.get_resource(path) for path in paths]
+        def run():
+            self.sbif.put_many(dsrepo.dm, data, paths)
+        def finished(result):
+            if done != None:
+                done()
+        return self._submit('PUT {}'.format(_paths_name(paths)), run, finished, failed, timeout)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    def _submit(self, name, run, done, failed, timeout):
+        request = SouthBoundRequest(name, done, failed)
+        if timeout == None:
+            timeout = self.timeout
+        def start():
+            # The timeout only starts once the call runs, not while it waits for a worker
+            if timeout != None:
+                wx.CallAfter(self._start_timer, request, timeout)
+            return run()
+        request.future = self.executor.submit(start)
+        request.future.add_done_callback(lambda future: wx.CallAfter(self._complete, request))
+        return request
+
+    def _start_timer(self, request, timeout):
+        if not request.finished:
+            request.timer = wx.CallLater(int(timeout * 1000), self._expire, request)
+
+    def _complete(self, request):
+        if request.finished:
+            return
+        request._finish()
+        try:
+            result = request.future.result()
+        except Exception as e:
+            self._fail(request, e)
+        else:
+            request.done(result)
+
+    def _expire(self, request):
+        if request.finished:
+            return
+        request._finish()
+        request.future.cancel()
+        self._fail(request, SouthBoundTimeout('{} timed out'.format(request.name)))
+
+    def _fail(self, request, e):
+        if request.failed != None:
+            request.failed(e)
+        else:
+            print("{} failed: {} - {}".format(request.name, str(e), type(e)))
+
+def _paths_name(paths):
+    return ', '.join(['/'.join(map(str, path)) for path in paths])
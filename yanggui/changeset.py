@@ -0,0 +1,121 @@
+# Copyright 2020-2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+import yangson
+
+class ChangeSet:
+    def __init__(self):
+        self.added = list()     # roots of subtrees only present in the new data
+        self.removed = list()   # roots of subtrees only present in the old data
+        self.modified = list()  # nodes present in both with a different value
+        self.refreshed = list() # nodes with an unchanged value but a new timestamp
+        self.retained = 0       # number of values of the kept data, by default the old data, not shared with the new data
+
+    def __bool__(self):
+        return len(self.added) + len(self.removed) + len(self.modified) + len(self.refreshed) > 0
+
+    def changes(self):
+        # (path, kind) for all entries, parents before their children
+        changes = [(path, 'added') for path in self.added]
+        changes += [(path, 'removed') for path in self.removed]
+        changes += [(path, 'modified') for path in self.modified]
+        changes += [(path, 'refreshed') for path in self.refreshed]
+        return sorted(changes, key=lambda change: change[0])
+
+    def subtrees(self):
+        # Roots of the changed subtrees, i.e. without the modified ancestors of other changes
+        paths = sorted(self.added + self.removed + self.modified)
+        roots = list()
+        for idx, path in enumerate(paths):
+            if idx + 1 < len(paths) and paths[idx + 1][:len(path)] == path:
+                continue
+            roots.append(path)
+        return roots
+
+def compare(old, new, kept=None):
+    # kept is e.g. an earlier version of the old data, whose values are counted in changes.retained
+    changes = ChangeSet()
+    if old == None and new == None:
+        pass
+    elif old == None:
+        changes.added.append(())
+    elif new == None:
+        changes.removed.append(())
+        changes.retained += _size(old.value)
+    else:
+        _compare(old.value, new.value, (), changes, False, old.value if kept == None else kept.value)
+    return changes
+
+def _compare(old, new, path, changes, parent_refreshed, kept):
+    # kept is the value at path in the kept data, its values are retained if they are those of the old data
+    if isinstance(old, yangson.instvalue.StructuredValue) and type(old) == type(new):
+        # Instance values are persistent, identical objects are unchanged subtrees and need no further look
+        if old is new:
+            return
+        if kept is old:
+            changes.retained += 1
+        n_changes = _count(changes)
+        refreshed = (old.timestamp != new.timestamp)
+        if isinstance(old, yangson.instvalue.ObjectValue):
+            for key in new:
+                if key in old:
+                    _compare(old[key], new[key], path + (key, ), changes, refreshed, _child(kept, old, key))
+                else:
+                    changes.added.append(path + (key, ))
+            for key in old:
+                if not key in new:
+                    changes.removed.append(path + (key, ))
+                    if _child(kept, old, key) is old[key]:
+                        changes.retained += _size(old[key])
+        else:
+            for idx in range(max(len(old), len(new))):
+                if idx < len(old) and idx < len(new):
+                    _compare(old[idx], new[idx], path + (idx, ), changes, refreshed, _child(kept, old, idx))
+                elif idx < len(new):
+                    changes.added.append(path + (idx, ))
+                else:
+                    changes.removed.append(path + (idx, ))
+                    if _child(kept, old, idx) is old[idx]:
+                        changes.retained += _size(old[idx])
+        if _count(changes) > n_changes:
+            changes.modified.append(path)
+        elif refreshed:
+            changes.refreshed.append(path)
+    elif type(old) != type(new) or old != new:
+        changes.modified.append(path)
+        if kept is old:
+            changes.retained += _size(old)
+    else:
+        # The value is kept with the replaced parent, even if it is equal to the new one
+        if kept is old:
+            changes.retained += 1
+        if parent_refreshed:
+            # Scalars carry the timestamp of their parent. Report them, so that e.g. a repeated GET
+            # of a counter with an unchanged value still reaches the graphs.
+            changes.refreshed.append(path)
+
+def _count(changes):
+    return len(changes.added) + len(changes.removed) + len(changes.modified)
+
+def _child(kept, old, key):
+    # Scalars are only shared along with their parent
+    if kept is old:
+        return old[key]
+    if not isinstance(old[key], yangson.instvalue.StructuredValue):
+        return None
+    if isinstance(kept, yangson.instvalue.ObjectValue):
+        return kept[key] if key in kept else None
+    if isinstance(kept, yangson.instvalue.ArrayValue) and isinstance(key, int):
+        return kept[key] if key < len(kept) else None
+    return None
+
+def _size(value):
+    size = 1
+    if isinstance(value, yangson.instvalue.ObjectValue):
+        for key in value:
+            size += _size(value[key])
+    elif isinstance(value, yangson.instvalue.ArrayValue):
+        for item in value:
+            size += _size(item)
+    return size
@@ -0,0 +1,52 @@
+# Copyright 2020-2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+import time
+
+import wx
+
+class UpdateCoalescer:
+    # Collects GUI updates and applies them at most max_rate times per second. Updates
+    # scheduled under the same key replace each other, so e.g. a property updated by
+    # several commits in between is only redrawn once with the latest data. All windows
+    # are frozen while the updates are applied.
+    def __init__(self, max_rate=10, windows=None):
+        self.interval = 1.0 / max_rate
+        self.windows = list(windows) if windows != None else list()
+        self.pending = dict()   # key -> (callback, args), in the order of the first scheduling
+        self.call = None
+        self.last_flush = 0
+
+    def add_window(self, window):
+        self.windows.append(window)
+
+    def schedule(self, key, callback, *args):
+        self.pending[key] = (callback, args)
+        if self.call == None:
+            delay = max(0, self.last_flush + self.interval - time.monotonic())
+            self.call = wx.CallLater(max(1, int(delay * 1000)), self.flush)
+
+    def cancel(self, key):
+        self.pending.pop(key, None)
+
+    def clear(self):
+        self.pending = dict()
+
+    def flush(self):
+        if self.call != None:
+            self.call.Stop()
+            self.call = None
+        self.last_flush = time.monotonic()
+        if len(self.pending) == 0:
+            return
+        pending, self.pending = self.pending, dict()
+        windows = [window for window in self.windows if window]   # skip destroyed windows
+        for window in windows:
+            window.Freeze()
+        try:
+            for callback, args in pending.values():
+                callback(*args)
+        finally:
+            for window in windows:
+                window.Thaw()
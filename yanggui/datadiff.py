@@ -0,0 +1,161 @@
+# Copyright 2020-2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+import html
+import json
+import urllib.parse
+
+import yangson
+
+class Edit:
+    def __init__(self, operation, target, pointer, schema_node, old=None, new=None, entry=False):
+        self.operation = operation      # 'create', 'delete' or 'replace'
+        self.target = target            # RESTCONF data resource path (RFC 8040)
+        self.pointer = pointer          # JSON pointer, valid when the edits are applied in order
+        self.schema_node = schema_node
+        self.old = old                  # cooked values
+        self.new = new
+        self.entry = entry              # the edit concerns a single list entry
+
+    def raw_value(self, value):
+        if value == None:
+            return None
+        return raw_value(value, self.schema_node, entry=self.entry)
+
+    def yang_patch_value(self):
+        name = '{1}:{0}'.format(*self.schema_node.qual_name)
+        value = self.raw_value(self.new)
+        return {name: [value] if self.entry else value}
+
+def raw_value(value, sn, entry=False):
+    if isinstance(sn, yangson.schemanode.AnyContentNode):
+        return sn.to_raw(value)
+    if isinstance(value, yangson.instvalue.ArrayValue) and not entry:
+        return [raw_value(v, sn, entry=True) for v in value]
+    if isinstance(value, yangson.instvalue.ObjectValue):
+        raw = dict()
+        for key in value:
+            if key[0] == '@':
+                raw[key] = raw_metadata(value[key], sn)
+            else:
+                raw[key] = raw_value(value[key], _child_schema_node(sn, key))
+        return raw
+    return sn.type.to_raw(value)
+
+def raw_metadata(metadata, sn):
+    # The annotations (RFC 7952) of an object with schema node sn or of one of its members,
+    # metadata is the value of an '@' member of the object
+    annotations = sn.schema_root().annotations
+    return {name: annotations[sn._iname2qname(name)].type.to_raw(value) for name, value in metadata.items()}
+
+def _child_schema_node(sn, key):
+    return sn.get_data_child(*sn._iname2qname(key))
+
+def _escape_pointer(key):
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+def _entry_keys(entry, sn):
+    keys = list()
+    for key in sn._key_members:
+        kn = _child_schema_node(sn, key)
+        value = kn.type.canonical_string(entry[key])
+        keys.append(urllib.parse.quote(value if value != None else str(entry[key]), safe=''))
+    return ','.join(keys)
+
+def compare(old, new):
+    edits = list()
+    _compare_object(old.value, new.value, old.schema_node, '', '', edits)
+    return edits
+
+def _compare_object(old, new, sn, target, pointer, edits):
+    for key in new:
+        if key[0] == '@':
+            continue
+        child_sn = _child_schema_node(sn, key)
+        child_target = '{}/{}'.format(target, key)
+        child_pointer = '{}/{}'.format(pointer, _escape_pointer(key))
+        if key in old:
+            _compare_member(old[key], new[key], child_sn, child_target, child_pointer, edits)
+        else:
+            edits.append(Edit('create', child_target, child_pointer, child_sn, new=new[key]))
+    for key in old:
+        if key[0] != '@' and not key in new:
+            edits.append(Edit('delete', '{}/{}'.format(target, key), '{}/{}'.format(pointer, _escape_pointer(key)), _child_schema_node(sn, key), old=old[key]))
+
+def _compare_member(old, new, sn, target, pointer, edits):
+    # Instance values are persistent, shared subtrees are identical and skipped
+    if old is new:
+        return
+    if isinstance(old, yangson.instvalue.ObjectValue) and isinstance(new, yangson.instvalue.ObjectValue):
+        _compare_object(old, new, sn, target, pointer, edits)
+    elif isinstance(sn, yangson.schemanode.ListNode) and len(sn.keys) > 0:
+        _compare_list(old, new, sn, target, pointer, edits)
+    elif type(old) != type(new) or old != new:
+        # Scalars, leaf-lists and lists without keys are replaced as a whole
+        edits.append(Edit('replace', target, pointer, sn, old=old, new=new))
+
+def _compare_list(old, new, sn, target, pointer, edits):
+    try:
+        old_keys = [_entry_keys(entry, sn) for entry in old]
+        new_keys = [_entry_keys(entry, sn) for entry in new]
+    except KeyError:
+        old_keys = new_keys = None # entries with missing keys cannot be matched
+    if old_keys == None or len(set(old_keys)) < len(old_keys) or len(set(new_keys)) < len(new_keys):
+        edits.append(Edit('replace', target, pointer, sn, old=old, new=new))
+        return
+    new_index = {key: idx for idx, key in enumerate(new_keys)}
+    old_index = {key: idx for idx, key in enumerate(old_keys)}
+    common = [key for key in old_keys if key in new_index]
+    if common != [key for key in new_keys if key in old_index]:
+        # Entries were reordered, which JSON pointers cannot follow entry by entry
+        edits.append(Edit('replace', target, pointer, sn, old=old, new=new))
+        return
+    for idx in reversed(range(len(old_keys))):
+        if not old_keys[idx] in new_index:
+            edits.append(Edit('delete', '{}={}'.format(target, old_keys[idx]), '{}/{}'.format(pointer, idx), sn, old=old[idx], entry=True))
+    for idx, key in enumerate(common):
+        entry_target = '{}={}'.format(target, key)
+        entry_pointer = '{}/{}'.format(pointer, idx)
+        _compare_member(old[old_index[key]], new[new_index[key]], sn, entry_target, entry_pointer, edits)
+    for idx, key in enumerate(new_keys):
+        if not key in old_index:
+            edits.append(Edit('create', '{}={}'.format(target, key), '{}/{}'.format(pointer, idx), sn, new=new[idx], entry=True))
+
+def to_json_patch(edits):
+    operations = {'create': 'add', 'delete': 'remove', 'replace': 'replace'}
+    patch = list()
+    for edit in edits:
+        op = {'op': operations[edit.operation], 'path': edit.pointer}
+        if edit.operation != 'delete':
+            op['value'] = edit.raw_value(edit.new)
+        patch.append(op)
+    return patch
+
+def to_yang_patch(edits, patch_id='yanggui-diff'):
+    patch_edits = list()
+    for idx, edit in enumerate(edits):
+        e = {'edit-id': 'edit{}'.format(idx + 1), 'operation': edit.operation, 'target': edit.target}
+        if edit.operation != 'delete':
+            e['value'] = edit.yang_patch_value()
+        patch_edits.append(e)
+    return {'ietf-yang-patch:yang-patch': {'patch-id': patch_id, 'edit': patch_edits}}
+
+def to_html(edits, max_length=500):
+    colors = {'create': '#aaffaa', 'delete': '#ffaaaa', 'replace': '#ffff77'}
+    def cell(edit, value):
+        if value == None:
+            return ''
+        text = json.dumps(edit.raw_value(value))
+        if len(text) > max_length:
+            text = text[:max_length] + ' ...'
+        return html.escape(text)
+    rows = list()
+    for edit in edits:
+        rows.append('<tr style="background-color:{}"><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>'.format(
+            colors[edit.operation], edit.operation, html.escape(edit.target), cell(edit, edit.old), cell(edit, edit.new)))
+    if len(rows) == 0:
+        rows.append('<tr><td colspan="4">No differences</td></tr>')
+    return ('<html><head><meta charset="utf-8"></head><body style="font-family:monospace">'
+            '<table border="1" cellspacing="0" cellpadding="3">'
+            '<tr><th>operation</th><th>path</th><th>old</th><th>new</th></tr>{}</table></body></html>').format(''.join(rows))
@@ -10,7 +10,7 @@ import wx.lib.scrolledpanel
 import wx.propgrid as wxpg
 import yangson
 
-from pubsub import pub
+from .rowmodel import RowModel
 
 def _AppendNodeToPath(path, iname):
     l = list(path)
@@ -19,16 +19,16 @@ def _AppendNodeToPath(path, iname):
 
 def _GetLeafRefChoices(property):
     choices = ['']
-    values = [0]
-    d = property.env['dsrepo'].get_resource(property.path)
-    if d != None:
-        ns = property.type.path.evaluate(d)
-        for idx, obj in enumerate(ns):
-            choices.append(property.type.canonical_string(obj.value))
-            values.append(idx + 1)
-    
+    targets = property.env['dsrepo'].leafref_index().choices(property.schemaNode, property.path)
+    if targets == None:
+        # Leafrefs with predicates are resolved by evaluating their path
+        d = property.env['dsrepo'].get_resource(property.path)
+        if d != None:
+            targets = [property.type.canonical_string(obj.value) for obj in property.type.path.evaluate(d)]
+    if targets != None:
+        choices += targets
         property.choices = choices
-    return choices, values
+    return choices, list(range(len(choices)))
 
 def _CreateNodeLabel(node):
     # Create labels insipred by https://tools.ietf.org/html/rfc8340
@@ -51,6 +51,63 @@ def _CreateNodeLabel(node):
             
     return label
 
+def _LeafType(leaf):
+    if isinstance(leaf.type, yangson.datatype.UnionType):
+        return leaf.type.types[0]
+    return leaf.type
+
+def _FormatInstData(data):
+    # The value a property of the node shows for the data, without creating the property
+    sn = data.schema_node
+    if isinstance(sn, yangson.schemanode.ContainerNode):
+        return _FormatObject(data)
+    if isinstance(sn, yangson.schemanode.ListNode):
+        if isinstance(data, yangson.instance.ArrayEntry):
+            return _FormatObject(data)
+        return _FormatList(data)
+    if isinstance(sn, yangson.schemanode.LeafListNode):
+        return json.dumps(data.value)
+    nodeType = _LeafType(sn)
+    if isinstance(nodeType, yangson.datatype.BooleanType):
+        return data.value
+    if isinstance(nodeType, yangson.datatype.BitsType):
+        return json.dumps(data.value)
+    if isinstance(nodeType, yangson.datatype.BinaryType):
+        return '0x{}'.format(data.value.hex())
+    if isinstance(nodeType, yangson.datatype.StringType):
+        return '\"{}\"'.format(nodeType.canonical_string(data.value))
+    return nodeType.canonical_string(data.value)
+
+def _FormatObject(data):
+    value = '{'
+    for iname in data:
+        if iname[0] == '@':
+            continue
+        value = '{}{}: {}, '.format(value, iname, _FormatInstData(data[iname]))
+        if(len(value) > 100):
+            break
+    if len(value) > 100:
+        value = value[0:100].rsplit(',', 1)[0] + ' ...'
+    else:
+        value = value.rsplit(',', 1)[0]
+    return value + '}'
+
+def _FormatList(data):
+    if len(data.value) == 0:
+        return '[]'
+    keys = data.schema_node.keys
+    entries = list()
+    indeces = set([0])
+    indeces.add(len(data.value) - 1)
+    for idx in sorted(indeces):
+        keyvals = []
+        for key in keys:
+            keyvals.append(str(data.value[idx][key[0]]))
+        entry = '({})'.format(', '.join(keyvals))
+        entries.append(entry)
+    sep = ', ' if len(data.value) == 2 else ', ..., '
+    return '[{}]'.format(sep.join(entries))
+
 def _FormatDescription(descr):
     lines = descr.split('\n')
 
@@ -99,14 +156,18 @@ class YangPropertyGrid(wxpg.PropertyGridManager):
         self.path = tuple()
         self.choices = list()
 
+        # The properties of a page are only created once it is selected
         self.children = sorted(self.schemaNode.children, key=lambda x: x.iname())
+        self.pages = dict()
         for child in self.children:
-            page = self.AddPage(label=child.iname(), pageObj=self.Page(child, self, self.env))
-            page.FitColumns()
+            self.pages[child.iname()] = self.Page(child, self, self.env)
+            self.AddPage(label=child.iname(), pageObj=self.pages[child.iname()])
             self.choices.append(child.iname())
+        self.pages[self.choices[0]].Populate()
 
         self.cb = wx.ComboBox(self.parent, choices=self.choices, style=wx.CB_READONLY, value=self.choices[0])
         self.cb.Bind(wx.EVT_COMBOBOX, self.OnCBSelect)
+        self.Bind(wxpg.EVT_PG_ITEM_EXPANDED, self.OnItemExpanded)
         sizer.Add(self.cb)
         sizer.Add(self, -1, wx.EXPAND)
         
@@ -114,21 +175,37 @@ class YangPropertyGrid(wxpg.PropertyGridManager):
         self.parent.Thaw()
         
     def OnCBSelect(self, e):
+        self.pages[e.GetString()].Populate()
         self.SelectPage(e.GetString())
 
+    def OnItemExpanded(self, e):
+        prop = e.GetProperty()
+        if isinstance(prop, YangPropertyGrid.YangPropertyBase):
+            prop.PopulateChildren()
+        e.Skip()
+
     class Page(wxpg.PropertyGridPage):
         def __init__(self, sn, parent, env):
             self.schemaNode = sn
             self.parent = parent
             self.env = env
             self.path = tuple()
+            self.page = self
+            self.populated = False
             super().__init__()
             phantomProperty = wxpg.StringProperty(label="Data node", name=sn.iname() + 'heading', value='Value')
             self.Append(phantomProperty) # FIXME: Without this, buttons for the first YANG property do not show
             self.SetPropertyReadOnly(phantomProperty, set=True, flags=wxpg.PG_DONT_RECURSE)
-            prop = YangPropertyGrid._CreateChildProperty(self, sn)
+
+        def Populate(self):
+            if self.populated:
+                return
+            self.populated = True
+            prop = YangPropertyGrid._CreateChildProperty(self, self.schemaNode)
             if prop != None:
                 self.Append(prop)
+                prop.RefreshInstData() # data published before the page was populated
+            self.FitColumns()
 
     def SetInstDataPath(self, path):
         self.path = path
@@ -170,10 +247,7 @@ class YangPropertyGrid(wxpg.PropertyGridManager):
             (yangson.datatype.InstanceIdentifierType, YangPropertyGrid.YangGenericProperty)
         ]
 
-        if isinstance(leaf.type, yangson.datatype.UnionType):
-            nodeType = leaf.type.types[0]
-        else:
-            nodeType = leaf.type
+        nodeType = _LeafType(leaf)
         for propClass in leafLookup:
             if isinstance(nodeType, propClass[0]):
                 prop = propClass[1](self, leaf, nodeType)
@@ -187,7 +261,7 @@ class YangPropertyGrid(wxpg.PropertyGridManager):
         for child in children:
             prop = YangPropertyGrid._CreateChildProperty(self, child)
             if prop != None:
-                self.AddPrivateChild(prop)
+                self.page.AppendIn(self, prop)
                 self.childProperties[child.iname()] = prop
 
     def _CreateChildProperty(self, child):
@@ -317,10 +391,10 @@ class YangPropertyGrid(wxpg.PropertyGridManager):
 
             def _ShowAdvancedOptions(self):
                 if 'obj' in self.items['ADD_TO_GRAPH']:
-                    is_in_graph = self.prop.env['graphViewer'].is_in_graph(self.prop.topic)
+                    is_in_graph = self.prop.env['graphViewer'].is_in_graph(self.prop.path)
                     self.items['ADD_TO_GRAPH']['obj'].Check(is_in_graph)
                 if 'obj' in self.items['GET_LOOP']:
-                    is_in_loop = self.prop.env['graphViewer'].is_in_loop(self.prop.topic)
+                    is_in_loop = self.prop.env['graphViewer'].is_in_loop(self.prop.path)
                     self.items['GET_LOOP']['obj'].Check(is_in_loop)
                 panel = self.prop.GetGrid().GetPanel()
                 panel.PopupMenu(self)
@@ -328,28 +402,24 @@ class YangPropertyGrid(wxpg.PropertyGridManager):
             def _OnGetLoop(self, e):
                 i = e.EventObject.items['GET_LOOP']
                 if i['obj'].IsChecked():
-                    self.prop.env['graphViewer'].add(self.prop.path, self.prop.topic, loop=True, plot=False)
+                    self.prop.env['graphViewer'].add(self.prop.path, loop=True, plot=False)
                 else:
-                    self.prop.env['graphViewer'].remove_from_data_loop(self.prop.topic)
+                    self.prop.env['graphViewer'].remove_from_data_loop(self.prop.path)
 
             def _OnAddToGraph(self, e):
                 i = e.EventObject.items['ADD_TO_GRAPH']
                 if i['obj'].IsChecked():
-                    self.prop.env['graphViewer'].add(self.prop.path, self.prop.topic)
+                    self.prop.env['graphViewer'].add(self.prop.path)
                 else:
-                    self.prop.env['graphViewer'].remove(self.prop.topic)
+                    self.prop.env['graphViewer'].remove(self.prop.path)
 
             def _OnPutList(self, e):
-                data = self.prop.env['dsrepo'].get_resource(self.prop.listPath)
-                if self.prop.env['southboundIf'] != None:
-                    self.prop.env['southboundIf'].put(self.prop.env['dsrepo'].dm, data, self.prop.listPath)
+                if self.prop.env['southbound'] != None:
+                    self.prop.env['southbound'].put(self.prop.env['dsrepo'], [self.prop.listPath])
 
             def _OnGetList(self, e):
-                if self.prop.env['southboundIf'] != None:
-                    data = self.prop.env['dsrepo'].get_resource(self.prop.listPath)
-                    data = self.prop.env['southboundIf'].get(self.prop.env['dsrepo'].dm, data, self.prop.listPath)
-                    if data != None:
-                        self.prop.env['dsrepo'].commit(data.top())                    
+                if self.prop.env['southbound'] != None:
+                    self.prop.env['southbound'].get(self.prop.env['dsrepo'], [self.prop.listPath])
 
         def OnEvent(self, propGrid, aProperty, ctrl, event):
             if event.GetEventType() == wx.wxEVT_BUTTON:
@@ -363,8 +433,7 @@ class YangPropertyGrid(wxpg.PropertyGridManager):
                 elif evtId == self.PUT:
                     self.Put(aProperty)
                 elif evtId == self.GET:
-                    self.Get(aProperty)
-                    aProperty.RecreateEditor()
+                    self.Get(aProperty, done=lambda changes: aProperty.RecreateEditor())
                 elif evtId == self.ADVANCED:
                     self.AdvancedMenu(aProperty)
                 return False
@@ -372,19 +441,15 @@ class YangPropertyGrid(wxpg.PropertyGridManager):
                 return super().OnEvent(propGrid, aProperty, ctrl, event)
 
         def Put(self, prop):
-            data = prop.env['dsrepo'].get_resource(prop.path)
-            if prop.env['southboundIf'] != None:
-                prop.env['southboundIf'].put(prop.env['dsrepo'].dm, data, prop.path)
-
-        def Get(self, prop):
-            if prop.env['southboundIf'] != None:
-                data = prop.env['dsrepo'].get_resource(prop.path)
-                if data == None:
+            if prop.env['southbound'] != None:
+                prop.env['southbound'].put(prop.env['dsrepo'], [prop.path])
+
+        def Get(self, prop, done=None):
+            # The GET runs in the background, its result is committed once it arrives
+            if prop.env['southbound'] != None:
+                if prop.env['dsrepo'].get_resource(prop.path) == None:
                     prop.Create()
-                    data = prop.env['dsrepo'].get_resource(prop.path)
-                data = prop.env['southboundIf'].get(prop.env['dsrepo'].dm, data, prop.path)
-                if data != None:
-                    prop.env['dsrepo'].commit(data.top())
+                prop.env['southbound'].get(prop.env['dsrepo'], [prop.path], done=done)
                 
     class YangChoiceEditor(YangEditor, wxpg.PGChoiceEditor):
         def __init__(self):
@@ -571,6 +636,7 @@ class YangPropertyGrid(wxpg.PropertyGridManager):
                 self.parent = self.GetGrid()
             self.schemaNode = sn
             self.env = parent.env
+            self.page = parent.page
             if self.schemaNode.description != None:
                 descr = _FormatDescription(self.schemaNode.description)
                 self.SetHelpString(descr)
@@ -649,13 +715,26 @@ class YangPropertyGrid(wxpg.PropertyGridManager):
         def UpdateChildren(self, data, path):
             pass
 
+        def PopulateChildren(self):
+            pass
+
+        def GetDataPath(self):
+            return self.path
+
+        def RefreshInstData(self):
+            data = self.env['dsrepo'].get_resource(self.GetDataPath())
+            self.UpdateData(data, self.GetDataPath())
+
         def DisplayYangInstData(self, data):
             if data != None:
                 self.dataValid = True
                 newValue = self._ConvertInstDataToValue(data)
                 if newValue != self.GetValue():
                     self.SetValue(newValue)
-                    self.GetGrid().Expand(self)
+                    # Collapsed properties summarize their data in the value, their children
+                    # are only created when they are expanded
+                    if getattr(self, 'populated', True):
+                        self.GetGrid().Expand(self)
             else:
                 self.GetGrid().Collapse(self)
                 if self.dataValid:
@@ -666,23 +745,31 @@ class YangPropertyGrid(wxpg.PropertyGridManager):
         def SetInitialPath(self):
             iname = self.schemaNode.iname()
             self.path = _AppendNodeToPath(self.parent.path, iname)
-            self.SubscribeTopic()
+            self.SubscribePath()
 
         def SetInstDataPath(self, path):
             if path != self.path:
                 self.path = path
-                self.SubscribeTopic(unsubfirst=True)
+                self.SubscribePath(unsubfirst=True)
 
-        def SubscribeTopic(self, path=None, unsubfirst=False):
+        def SubscribePath(self, path=None, unsubfirst=False):
             if unsubfirst:
-                pub.unsubscribe(self.DataCallback, self.topic)
+                self.env['dsrepo'].unsubscribe(self.subscribedPath, self.DataCallback)
             if path == None:
                 path = self.path
-            self.topic = self.env['dsrepo'].path_to_topic(path, self.schemaNode)
-            pub.subscribe(self.DataCallback, self.topic)
+            self.subscribedPath = path
+            self.env['dsrepo'].subscribe(path, self.DataCallback)
 
         def DataCallback(self, data):
-            self.DisplayYangInstData(data)
+            self._ScheduleDisplay(self.DisplayYangInstData, data)
+
+        def _ScheduleDisplay(self, display, data):
+            # Frequent commits only redraw the property with the latest data, a few times per second
+            coalescer = self.env.get('coalescer')
+            if coalescer != None:
+                coalescer.schedule(id(self), display, data)
+            else:
+                display(data)
 
         def _ParseInstDataFromValue(self, value):
             return self.type.parse_value(value)
@@ -880,15 +967,32 @@ class YangPropertyGrid(wxpg.PropertyGridManager):
             super().__init__(label=self.label, name=self.name)
             YangPropertyGrid.YangPropertyBase.__init__(self, parent, sn, None)
             self._SetEditor()
+            # The child properties are created when the property is first expanded, until
+            # then a placeholder makes it expandable. It is a regular child like them, as wx
+            # does not allow to mix private children with children added by AppendIn.
             self.childProperties = dict()
-            YangPropertyGrid._AddChildrenToParentProperty(self, self.schemaNode.data_children())
+            self.populated = False
+            self.placeholder = wxpg.StringProperty(label='...', name=self.name + '/...')
+            self.AppendChild(self.placeholder)
             self.SetValueToUnspecified()
+
+        def PopulateChildren(self):
+            if self.populated:
+                return
+            self.populated = True
+            self.page.DeleteProperty(self.placeholder)
+            self.placeholder = None
+            YangPropertyGrid._AddChildrenToParentProperty(self, self.schemaNode.data_children())
+            path = self.GetDataPath()
+            self.UpdateChildren(self.env['dsrepo'].get_resource(path), path)
         
         def ConvertDataToObject(self, data):
             return yangson.instvalue.ObjectValue(val=data)
             
         def UpdateChildren(self, data, path):
             # TODO: do not update children if data is None and was None before
+            if not self.populated:
+                return
             items = self.GetChildCount()
             for i in range(items):
                 prop = self.Item(i)
@@ -903,6 +1007,7 @@ class YangPropertyGrid(wxpg.PropertyGridManager):
             self.SetEditor("YangTextCtrlEditor")
 
         def GetDefaultData(self):
+            self.PopulateChildren()
             value = dict()
             items = self.GetChildCount()
             for i in range(items):
@@ -917,21 +1022,9 @@ class YangPropertyGrid(wxpg.PropertyGridManager):
             return True
         
         def _ConvertInstDataToValue(self, data):
-            if data != None:
-                value = '{'
-                for iname in data:
-                    child_value = self.childProperties[iname]._ConvertInstDataToValue(data[iname])
-                    value = '{}{}: {}, '.format(value, iname, child_value)
-                    if(len(value) > 100):
-                        break
-                if len(value) > 100:
-                    value = value[0:100].rsplit(',', 1)[0] + ' ...'
-                else:
-                    value = value.rsplit(',', 1)[0]
-                value = value + '}'
-            else:
-                value = ''
-            return value
+            if data == None:
+                return ''
+            return _FormatObject(data)
 
     class YangLeafListProperty(wxpg.StringProperty, YangPropertyBase):
         def __init__(self, parent, sn):
@@ -982,9 +1075,8 @@ class YangPropertyGrid(wxpg.PropertyGridManager):
                 self.index = index
                 self.RefreshInstData()
 
-        def RefreshInstData(self):
-            data = self.env['dsrepo'].get_resource(self.listPath)
-            self.UpdateData(data, self.listPath)
+        def GetDataPath(self):
+            return self.listPath
             
         def UpdateChildren(self, data, path):
             entryData = None
@@ -994,7 +1086,7 @@ class YangPropertyGrid(wxpg.PropertyGridManager):
             super().UpdateChildren(entryData, entryPath)
             
         def DataCallback(self, data):
-            self.DisplayYangEntryInstData(data)
+            self._ScheduleDisplay(self.DisplayYangEntryInstData, data)
 
         def DisplayYangEntryInstData(self, data):
             self.max_index = -1
@@ -1032,33 +1124,15 @@ class YangPropertyGrid(wxpg.PropertyGridManager):
             return True
         
         def _ConvertInstDataToValue(self, data):
-            if isinstance(data, yangson.instance.ArrayEntry):
-                return YangPropertyGrid.YangContainerProperty._ConvertInstDataToValue(self, data)
-            else:
-                if data == None:
-                    return ''
-                elif len(data.value) == 0:
-                    return '[]'
-                else:
-                    keys = data.schema_node.keys
-                    entries = list()
-                    indeces = set([0])
-                    indeces.add(len(data.value) - 1)
-                    for idx in indeces:
-                        keyvals = []
-                        for key in keys:
-                            keyvals.append(str(data[idx][key[0]].value))
-                        entry = '({})'.format(', '.join(keyvals))
-                        entries.append(entry)
-                    sep = ', ' if len(data.value) == 2 else ', ..., '
-                    value = '[{}]'.format(sep.join(entries))
-                return value
+            if data == None:
+                return ''
+            return _FormatInstData(data)
 
         def SetInitialPath(self):
             iname = self.schemaNode.iname()
             self.listPath = _AppendNodeToPath(self.parent.path, iname)
             self.path = _AppendNodeToPath(self.listPath, self.index)
-            self.SubscribeTopic()
+            self.SubscribePath()
 
 class YangListViewer(wx.Frame):
     def __init__(self, aProperty):
@@ -1068,15 +1142,17 @@ class YangListViewer(wx.Frame):
         self.schemaNode = aProperty.schemaNode
         self.env = aProperty.env
         self.path = aProperty.listPath
-        self.topic = self.env['dsrepo'].path_to_topic(self.path, self.schemaNode)
+        aProperty.PopulateChildren() # the columns are formatted by the child properties
         super().__init__(None, title='/'.join(list(map(str, self.path))))
         self.panel = wx.Panel(self)
         self._InitCtrl()
-        pub.subscribe(self.DisplayYangInstData, self.topic)      
+        self.env['dsrepo'].subscribe(self.path, self.DisplayYangInstData)
         self.Bind(wx.EVT_CLOSE, self._OnCloseEvent, self)
 
     def _OnCloseEvent(self, e):
-        pub.unsubscribe(self.DisplayYangInstData, self.topic)
+        self.env['dsrepo'].unsubscribe(self.path, self.DisplayYangInstData)
+        if self.env.get('coalescer') != None:
+            self.env['coalescer'].cancel(id(self))
         e.Skip()        
 
     class YangListCtrl(wx.ListCtrl):
@@ -1086,6 +1162,9 @@ class YangListViewer(wx.Frame):
             self.EnableAlternateRowColours()
             self.columnMinWidth = list()
             self.columns = self._AddChildrenToTable(self.parent.schemaNode.data_children())
+            self.rows = RowModel(self.columns, self._FormatCell)
+            self.sampleSize = 200 # rows measured to estimate the column widths
+            self.cellMargin = 12
             self.Bind(wx.EVT_LIST_ITEM_SELECTED, self._OnSelectEvent, self)
             self.Bind(wx.EVT_LIST_ITEM_DESELECTED, self._OnSelectEvent, self)
 
@@ -1104,23 +1183,28 @@ class YangListViewer(wx.Frame):
             return columns
 
         def RearrangeColumns(self):
+            # Autosizing would format every row of the list, the widths are estimated from
+            # a sample of the rows and the rows currently shown instead
+            rows = set(self.rows.sample(self.sampleSize))
+            top = self.GetTopItem()
+            rows.update(range(top, min(len(self.rows), top + self.GetCountPerPage() + 1)))
             self.Freeze()
             for col in range(0, len(self.columns)):
-                self.SetColumnWidth(col, wx.LIST_AUTOSIZE)
-                if self.GetColumnWidth(col) < self.columnMinWidth[col]:
-                    self.SetColumnWidth(col, self.columnMinWidth[col])
+                width = max([self.GetTextExtent(self.rows.text(row, col)).width for row in rows], default=0)
+                self.SetColumnWidth(col, max(width + self.cellMargin, self.columnMinWidth[col]))
             self.Thaw()
 
         def OnGetItemText(self, item, column):
-            value = ''
-            path = self.parent.path + (item,)
-            d = self.parent.env['dsrepo'].get_resource(path)
-            if d != None:
-                if self.columns[column] in d:
-                    obj = d[self.columns[column]]
-                    prop = self.parent.property.childProperties[obj.schema_node.iname()]
-                    value = str(prop._ConvertInstDataToValue(obj))
-            return value
+            if item >= len(self.rows):
+                return ''
+            return self.rows.text(item, column)
+
+        def _FormatCell(self, entry, column):
+            if not column in entry:
+                return ''
+            obj = entry[column]
+            prop = self.parent.property.childProperties[obj.schema_node.iname()]
+            return str(prop._ConvertInstDataToValue(obj))
 
         def _OnSelectEvent(self, e):
             idx = self.GetFirstSelected()
@@ -1234,15 +1318,18 @@ class YangListViewer(wx.Frame):
     def RefreshInstData(self):
         data = None
         data = self.env['dsrepo'].get_resource(self.path)
-        if data != None:
-            items = len(data.value)
-        else:
-            items = 0
+        # Only the rows of changed entries are formatted again
+        changed = self.list.rows.update(data)
+        items = len(self.list.rows)
         self.list.SetItemCount(items)
-        self.list.RefreshItems(0, items)
-        self.list.RearrangeColumns()
+        if changed:
+            self.list.RefreshItems(0, items)
+            self.list.RearrangeColumns()
         self.nodeButtons.UpdateButtonState(data)
         self.panel.Layout()
 
     def DisplayYangInstData(self, data):
-        self.RefreshInstData()
+        if self.env.get('coalescer') != None:
+            self.env['coalescer'].schedule(id(self), self.RefreshInstData)
+        else:
+            self.RefreshInstData()
@@ -0,0 +1,347 @@
+# Copyright 2020-2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+import codecs
+import copyreg
+import hashlib
+import json
+import os
+import pickle
+import re
+import tempfile
+
+import yangson
+
+from . import datadiff
+
+class LoadCancelled(Exception):
+    pass
+
+class SaveCancelled(Exception):
+    pass
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+class JsonReader:
+    # Reads a JSON document piece by piece, the caller walks the objects and arrays it
+    # expects and reads the remaining values whole. Only the values being read have to
+    # be held in raw form. progress(bytes_read) is called for every chunk read.
+    def __init__(self, f, progress=None, chunk_size=1024*1024):
+        self.f = f
+        self.progress = progress
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
+        self.sha256 = hashlib.sha256()
+
+    def members(self):
+        # The names of the members of an object, the value of each has to be read before
+        # the next name, with value(',}') or by walking it
+        yield from self._items('{', '}', self._name)
+
+    def entries(self):
+        # The indices of the entries of an array, read each with value(',]') or by walking it
+        yield from self._items('[', ']', None)
+
+    def value(self, terminators=''):
+        return self._decode(terminators)
+
+    def peek(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._read(self.chunk_size)
+
+    def end(self):
+        if self.peek() != '':
+            raise json.JSONDecodeError('Extra data', self.buffer, self.pos)
+
+    def _items(self, start, stop, key):
+        self._expect(start)
+        if self.peek() == stop:
+            self.pos += 1
+            return
+        idx = 0
+        while True:
+            yield key() if key != None else idx
+            idx += 1
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self._expect(stop)
+                return
+
+    def _name(self):
+        name = self._decode(':')
+        self._expect(':')
+        return name
+
+    def _read(self, size):
+        chunk = self.f.read(size)
+        self.bytes_read += len(chunk)
+        self.sha256.update(chunk)
+        self.eof = (len(chunk) == 0)
+        self.buffer = self.buffer[self.pos:] + self.utf8.decode(chunk, final=self.eof)
+        self.pos = 0
+        if self.progress != None:
+            self.progress(self.bytes_read)
+
+    def _expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError("Expecting '{}'".format(char), self.buffer, self.pos)
+        self.pos += 1
+
+    def _decode(self, terminators):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number cut off by the end of the buffer also decodes, so only accept
+                # the value once the character following it has been read
+                follow = _WHITESPACE.match(self.buffer, end).end()
+                if self.eof or (follow < len(self.buffer) and self.buffer[follow] in terminators):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Grow the buffer geometrically, so that large values are not re-parsed too often
+            self._read(max(self.chunk_size, len(self.buffer) - self.pos))
+
+def load(dm, file_name, progress=None, snapshot_file=None):
+    # progress(bytes_done, bytes_total) is called for every chunk read from the file,
+    # returning False from it cancels the load. With a snapshot_file, a snapshot
+    # of the data is reused for as long as the file is unchanged.
+    if snapshot_file != None:
+        root = load_snapshot(dm, snapshot_file, file_name)
+        if root != None:
+            return root
+    stat = os.stat(file_name)
+    total = stat.st_size
+    def report(bytes_read):
+        if progress != None and progress(bytes_read, total) == False:
+            raise LoadCancelled(file_name)
+    with open(file_name, 'rb') as f:
+        reader = JsonReader(f, report)
+        value = _load_object(reader, dm.schema, '')
+        reader.end()
+    root = yangson.instance.RootNode(value, dm.schema, dm.schema_data, value.timestamp)
+    if snapshot_file != None:
+        save_snapshot(dm, root, snapshot_file, _source_info(stat, reader.sha256))
+    return root
+
+def _load_object(reader, sn, jptr):
+    # The cooked value of an object, as InternalNode.from_raw returns it. Containers and lists
+    # are converted while they are read, the lists one entry at a time, everything else is
+    # read whole and converted by yangson.
+    value = yangson.instvalue.ObjectValue()
+    names = set()
+    annotations = dict()
+    for name in reader.members():
+        names.add(name)
+        if name[0] == '@':
+            annotations[name] = reader.value(',}')
+            continue
+        child = sn.get_data_child(*sn._iname2qname(name))
+        if child != None and (jptr == '' or sn.ns != child.ns):
+            iname = '{1}:{0}'.format(*child.qual_name)
+        else:
+            iname = name
+        if isinstance(child, yangson.schemanode.ContainerNode) and reader.peek() == '{':
+            value[iname] = _load_object(reader, child, jptr + '/' + name)
+        elif isinstance(child, yangson.schemanode.ListNode) and reader.peek() == '[':
+            entries = list()
+            for idx in reader.entries():
+                entries.extend(child.from_raw([reader.value(',]')], jptr + '/' + name))
+            value[iname] = yangson.instvalue.ArrayValue(entries)
+        else:
+            value.update(sn.from_raw({name: reader.value(',}')}, jptr))
+    # Annotations are converted once it is known that their targets exist (RFC 7952)
+    for name, raw in annotations.items():
+        if name != '@' and not name[1:] in names:
+            raise yangson.exceptions.MissingAnnotationTarget(jptr, name[1:])
+        value[name] = sn._process_metadata(raw, jptr if name == '@' else jptr + '/' + name[1:])
+    return value
+
+class JsonWriter:
+    # Serializes cooked instance values straight to a file, without building
+    # the raw value of the whole tree first. indent=None writes compact JSON.
+    def __init__(self, f, indent=4, chunk_size=1024*1024):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.indent = indent
+        self.chunk_size = chunk_size
+        self.separators = (',', ': ') if indent != None else (',', ':')
+        self.chunks = list()
+        self.size = 0
+
+    def write_member(self, name, value, sn, level, first):
+        # sn is the schema node of the member, or of the object for annotations ('@' members)
+        self._write('' if first else self.separators[0])
+        self._newline(level)
+        self._write(json.dumps(name) + self.separators[1])
+        if name[0] == '@':
+            self._write_raw(datadiff.raw_metadata(value, sn), level)
+        else:
+            self.write_value(value, sn, level)
+
+    def write_value(self, value, sn, level, entry=False):
+        if isinstance(sn, yangson.schemanode.AnyContentNode):
+            self._write_raw(sn.to_raw(value), level)
+        elif isinstance(value, yangson.instvalue.ArrayValue) and not entry:
+            self._write('[')
+            for idx, item in enumerate(value):
+                self._write('' if idx == 0 else self.separators[0])
+                self._newline(level + 1)
+                self.write_value(item, sn, level + 1, entry=True)
+            if len(value) > 0:
+                self._newline(level)
+            self._write(']')
+        elif isinstance(value, yangson.instvalue.ObjectValue):
+            self._write('{')
+            first = True
+            for name in value:
+                child = sn if name[0] == '@' else sn.get_data_child(*sn._iname2qname(name))
+                self.write_member(name, value[name], child, level + 1, first)
+                first = False
+            if not first:
+                self._newline(level)
+            self._write('}')
+        else:
+            self._write_raw(sn.type.to_raw(value), level)
+
+    def flush(self):
+        text = ''.join(self.chunks)
+        self.f.write(text)
+        self.sha256.update(text.encode('utf-8'))
+        self.chunks = list()
+        self.size = 0
+
+    def _write_raw(self, raw, level):
+        text = json.dumps(raw, indent=self.indent, separators=self.separators)
+        if self.indent != None and '\n' in text:
+            text = text.replace('\n', '\n' + ' ' * (self.indent * level))
+        self._write(text)
+
+    def _newline(self, level):
+        if self.indent != None:
+            self._write('\n' + ' ' * (self.indent * level))
+
+    def _write(self, text):
+        self.chunks.append(text)
+        self.size += len(text)
+        if self.size >= self.chunk_size:
+            self.flush()
+
+def save(root, file_name, indent=4, progress=None, dm=None, snapshot_file=None):
+    # The data is written to a temporary file next to the target, which is only
+    # replaced once the write is complete. progress(members_done, members_total)
+    # is called after each top level member, returning False from it cancels the save.
+    file_name = os.path.abspath(file_name)
+    fd, tmp_name = _temp_file(file_name)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            writer = JsonWriter(f, indent)
+            members = list(root.value)
+            writer._write('{')
+            for idx, name in enumerate(members):
+                sn = root.schema_node
+                if name[0] != '@':
+                    sn = sn.get_data_child(*sn._iname2qname(name))
+                writer.write_member(name, root.value[name], sn, 1, idx == 0)
+                if progress != None and progress(idx + 1, len(members)) == False:
+                    raise SaveCancelled(file_name)
+            if len(members) > 0:
+                writer._newline(0)
+            writer._write('}')
+            writer.flush()
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(file_name):
+            os.chmod(tmp_name, os.stat(file_name).st_mode & 0o7777)
+        else:
+            # mkstemp creates the file readable by the owner only
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_name, 0o666 & ~umask)
+        os.replace(tmp_name, file_name)
+    except BaseException:
+        os.remove(tmp_name)
+        raise
+    if snapshot_file != None:
+        save_snapshot(dm, root, snapshot_file, _source_info(os.stat(file_name), writer.sha256))
+
+# Snapshots hold the cooked instance values, pickled behind a header identifying
+# the JSON file and the data model they were created from. Loading them skips
+# both the JSON parsing and the conversion of the raw values.
+
+SNAPSHOT_VERSION = 1
+
+def snapshot_path(snapshot_dir, file_name):
+    name = hashlib.sha256(os.path.abspath(file_name).encode()).hexdigest()
+    return os.path.join(snapshot_dir, '{}.snapshot'.format(name))
+
+def save_snapshot(dm, root, snapshot_file, source):
+    try:
+        os.makedirs(os.path.dirname(snapshot_file), exist_ok=True)
+        fd, tmp_name = _temp_file(snapshot_file)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(_snapshot_header(dm, source), f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickler = pickle.Pickler(f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickler.dispatch_table = _snapshot_dispatch_table
+                pickler.dump(root.value)
+            os.replace(tmp_name, snapshot_file)
+        except BaseException:
+            os.remove(tmp_name)
+            raise
+    except Exception as e:
+        print("Failed to write data snapshot {}. Exception: {} - {}".format(snapshot_file, str(e), type(e)))
+
+def load_snapshot(dm, snapshot_file, file_name):
+    # Returns None if there is no snapshot matching the file and data model
+    try:
+        with open(snapshot_file, 'rb') as f:
+            header = pickle.load(f)
+            stat = os.stat(file_name)
+            if header['source']['mtime'] != stat.st_mtime_ns or header['source']['size'] != stat.st_size:
+                return None
+            if header != _snapshot_header(dm, _source_info(stat, _hash_file(file_name))):
+                return None
+            value = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print("Ignoring unusable data snapshot {}. Exception: {} - {}".format(snapshot_file, str(e), type(e)))
+        return None
+    return yangson.instance.RootNode(value, dm.schema, dm.schema_data, value.timestamp)
+
+def _snapshot_header(dm, source):
+    return {'version': SNAPSHOT_VERSION, 'module-set-id': dm.module_set_id(), 'source': source}
+
+def _source_info(stat, sha256):
+    return {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': sha256.hexdigest()}
+
+def _hash_file(file_name, chunk_size=1024*1024):
+    sha256 = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256
+
+def _temp_file(file_name):
+    return tempfile.mkstemp(prefix='.{}.'.format(os.path.basename(file_name)), suffix='.tmp',
+                            dir=os.path.dirname(os.path.abspath(file_name)))
+
+# Rebuild structured values through their constructors, which is much faster than
+# the item by item restore of dict and list subclasses. The values get a new timestamp,
+# as when they are converted from raw values.
+_snapshot_dispatch_table = copyreg.dispatch_table.copy()
+_snapshot_dispatch_table[yangson.instvalue.ObjectValue] = lambda value: (yangson.instvalue.ObjectValue, (dict(value), ))
+_snapshot_dispatch_table[yangson.instvalue.ArrayValue] = lambda value: (yangson.instvalue.ArrayValue, (list(value), ))
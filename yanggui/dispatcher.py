@@ -0,0 +1,112 @@
+# Copyright 2020-2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+import weakref
+
+class _TrieNode:
+    __slots__ = ('parent', 'key', 'children', 'listeners')
+
+    def __init__(self, parent=None, key=None):
+        self.parent = parent
+        self.key = key
+        self.children = dict()  # path element -> _TrieNode
+        self.listeners = list() # weak references to listener(data)
+
+class Dispatcher:
+    # Delivers changes of the instance data to listeners subscribed to instance paths.
+    # Listeners are only weakly referenced, like with pubsub, and trie branches without
+    # listeners are dropped as soon as they become empty.
+    def __init__(self):
+        self.root = _TrieNode()
+
+    def subscribe(self, path, listener):
+        node = self.root
+        for key in path:
+            child = node.children.get(key)
+            if child == None:
+                child = _TrieNode(node, key)
+                node.children[key] = child
+            node = child
+        if self._find(node, listener) == None:
+            node.listeners.append(_weak_ref(listener, lambda ref: self._discard(node, ref)))
+
+    def unsubscribe(self, path, listener):
+        node = self._lookup(path)
+        if node == None:
+            return
+        ref = self._find(node, listener)
+        if ref != None:
+            self._discard(node, ref)
+
+    def unsubscribe_all(self):
+        self.root = _TrieNode()
+
+    def has_listeners(self, path=()):
+        return self._lookup(path) != None
+
+    def dispatch(self, changes, resolve):
+        # changes is a ChangeSet, resolve(path, removed) returns the instance node at path
+        # in the new data, or the old data for removed subtrees. Each listener at a changed
+        # path, or below an added or removed subtree, is called once with its node.
+        deliveries = list()
+        for path, kind in changes.changes():
+            node = self._lookup(path)
+            if node == None:
+                continue
+            if kind == 'added' or kind == 'removed':
+                self._collect(node, path, kind == 'removed', deliveries)
+            elif len(node.listeners) > 0:
+                deliveries.append((node, path, False))
+        for node, path, removed in deliveries:
+            listeners = self._alive(node)
+            if len(listeners) == 0:
+                continue
+            data = resolve(path, removed)
+            for listener in listeners:
+                listener(None if removed else data)
+
+    def _collect(self, node, path, removed, deliveries):
+        if len(node.listeners) > 0:
+            deliveries.append((node, path, removed))
+        for key, child in list(node.children.items()):
+            self._collect(child, path + (key, ), removed, deliveries)
+
+    def _lookup(self, path):
+        node = self.root
+        for key in path:
+            node = node.children.get(key)
+            if node == None:
+                return None
+        return node
+
+    def _find(self, node, listener):
+        for ref in node.listeners:
+            if ref() == listener:
+                return ref
+        return None
+
+    def _alive(self, node):
+        listeners = list()
+        for ref in node.listeners:
+            listener = ref()
+            if listener != None:
+                listeners.append(listener)
+        return listeners
+
+    def _discard(self, node, ref):
+        # Also called when a listener has been garbage collected
+        if ref in node.listeners:
+            node.listeners.remove(ref)
+            self._prune(node)
+
+    def _prune(self, node):
+        while node.parent != None and len(node.listeners) == 0 and len(node.children) == 0:
+            if node.parent.children.get(node.key) is node:
+                del node.parent.children[node.key]
+            node = node.parent
+
+def _weak_ref(listener, callback):
+    if hasattr(listener, '__self__') and hasattr(listener, '__func__'):
+        return weakref.WeakMethod(listener, callback)
+    return weakref.ref(listener, callback)
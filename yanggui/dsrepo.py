@@ -2,184 +2,370 @@
 #
 # SPDX-License-Identifier: LGPL-3.0-or-later
 
+import contextlib
 import json
 import yangson
-import difflib
-from pubsub import pub
+
+from . import changeset
+from . import datadiff
+from . import datafile
+from .dispatcher import Dispatcher
+from .errorstore import ErrorStore
+from .leafrefindex import LeafrefIndex
+from .validator import LazyArrayEntry, Validator
 
 class DataStoreRepo:
-    def __init__(self, dm):
+    RESOURCE_CACHE_SIZE = 200000
+
+    def __init__(self, dm, worker=None, history_budget=1000000, snapshot_dir=None):
         self.dm = dm
         self.datastores = dict()
-        self.errorLog = list()
+        self.generations = dict()   # datastore name -> number of times the datastore was replaced
+        self._resource_cache = dict() # datastore name -> (generation, {path: instance node})
+        self._transactions = 0
+        self._transaction_base = dict() # datastore name -> datastore when the transaction started
+        self._transaction_recorded = set() # names of the datastores with commits to record in the history
+        # Earlier versions of the default datastore share all unchanged subtrees with the current one,
+        # so the history is bounded by the number of instance values only it keeps alive
+        self.history_budget = history_budget
+        self.undo_history = list()  # (datastore, cost), oldest first
+        self.redo_history = list()  # (datastore, cost), latest undone last
+        self._history_cost = 0
+        self.errorLog = ErrorStore()
         self.error_log_callbacks = list()
-   
+        self.change_callbacks = list()
+        self.dispatcher = Dispatcher()
+        self._leafref_index = None  # built with the first commit or use, then updated with every commit
+        self.validator = Validator()
+        # With a worker, loading, validation, saving and diffing run in the background
+        # and the validation works on its own copy of the error log
+        self.worker = worker
+        self._errors = self.errorLog
+        # With a snapshot directory, loaded and saved files are also kept as binary snapshots
+        self.snapshot_dir = snapshot_dir
+
     def load_raw(self, inst_raw, name='default'):
-        datastore = self.dm.from_raw(inst_raw)
-        self.datastores[name] = datastore
-        self.datastores['load'] = datastore
-        self._find_all_errors(datastore)
-        self._publish_data(None, self.datastores[name], publish_on_no_data=True)
-   
-    def load(self, file_name, name='default'):
-        with open(file_name, 'r') as f:
+        self.load_datastore(self.dm.from_raw(inst_raw), name)
+
+    def load(self, file_name, name='default', progress=None, done=None, failed=None):
+        def run(progress):
             print("Loading YANG Instance Data from {}".format(file_name))
-            inst_raw = json.load(f)
-            self.load_raw(inst_raw, name)
-            f.close()
-
-    def save(self, file_name, name='default'):
-        self.datastores['load'] = self.get_resource()
-        inst_raw = self.get_resource().raw_value()
-        with open(file_name, 'w') as f:
-            json.dump(inst_raw, f, indent=4)
-            f.close()
-
-    def commit(self, ds, name='default'):
+            return datafile.load(self.dm, file_name, progress, snapshot_file=self._snapshot_file(file_name))
+        def install(datastore):
+            self.load_datastore(datastore, name)
+            if done != None:
+                done()
+        self._execute('Loading {}'.format(file_name), run, install, failed, progress)
+
+    def load_datastore(self, datastore, name='default'):
+        self._set_datastore(name, datastore)
+        self._set_datastore('load', datastore)
+        if name == 'default':
+            self.clear_history()
+        self._revalidate_all(datastore)
+        self._publish_data(None, datastore, changeset.compare(None, datastore))
+
+    def save(self, file_name, name='default', done=None, failed=None, compact=False):
+        root = self.get_resource()
+        self._set_datastore('load', root)
+        def run(progress):
+            datafile.save(root, file_name, indent=None if compact else 4, progress=progress,
+                          dm=self.dm, snapshot_file=self._snapshot_file(file_name))
+        self._execute('Saving {}'.format(file_name), run, done, failed)
+
+    def _snapshot_file(self, file_name):
+        if self.snapshot_dir == None:
+            return None
+        return datafile.snapshot_path(self.snapshot_dir, file_name)
+
+    def commit(self, ds, name='default', record=True):
+        # Without record, the commit can not be undone, e.g. for data retrieved from a device
         old_ds = self.datastores[name]
-        self.datastores[name] = ds
-        self._find_all_errors(self.datastores[name])
-        self._publish_data(old_ds, ds)
+        self._set_datastore(name, ds)
+        if self._transactions > 0:
+            # Validated and published when the transaction is closed
+            self._transaction_base.setdefault(name, old_ds)
+            if record:
+                self._transaction_recorded.add(name)
+            return None
+        changes = self._apply(old_ds, ds, name)
+        if record and name == 'default':
+            self._record(old_ds, ds, changes)
+        elif name == 'default':
+            self._charge(old_ds, ds)
+        return changes
+
+    def merge(self, root, paths, base, name='default'):
+        # Commits the data at paths of root, which was derived from the datastore base, e.g.
+        # by a southbound GET. Edits made to the datastore since then are kept. The merge is not
+        # recorded in the history, so undo and redo only step through the edits of the user.
+        if self.datastores[name] is base:
+            return self.commit(root, name, record=False)
+        with self.transaction():
+            for path in paths:
+                node = self.get_resource(path, root=root)
+                target = self.get_resource(path, name=name)
+                if node == None and target != None:
+                    self.commit(target.up().delete_item(target.name).top(), name, record=False)
+                elif node != None and target != None:
+                    self.commit(target.update(node.value).top(), name, record=False)
+                elif node != None and not isinstance(path[-1], int):
+                    parent = self.get_resource(path[:-1], name=name)
+                    if parent != None:
+                        self.commit(parent.put_member(path[-1], node.value).top(), name, record=False)
+        return None
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # Commits within the transaction only update the datastores, the changes are
+        # validated and published once when the outermost transaction is closed.
+        # If it is left with an exception, the datastores are rolled back instead.
+        self._transactions += 1
+        try:
+            yield
+        except BaseException:
+            self._transactions -= 1
+            if self._transactions == 0:
+                base, self._transaction_base = self._transaction_base, dict()
+                self._transaction_recorded = set()
+                for name, ds in base.items():
+                    self._set_datastore(name, ds)
+            raise
+        self._transactions -= 1
+        if self._transactions == 0:
+            base, self._transaction_base = self._transaction_base, dict()
+            recorded, self._transaction_recorded = self._transaction_recorded, set()
+            for name, old_ds in base.items():
+                changes = self._apply(old_ds, self.datastores[name], name)
+                if name in recorded and name == 'default':
+                    self._record(old_ds, self.datastores[name], changes)
+                elif name == 'default':
+                    self._charge(old_ds, self.datastores[name])
+
+    def _apply(self, old_ds, ds, name='default'):
+        changes = changeset.compare(old_ds, ds)
+        referrers = None
+        if name == 'default':
+            if self._leafref_index == None:
+                self._leafref_index = LeafrefIndex(self.dm.schema)
+            referrers = self._leafref_index.update(old_ds, ds, changes)
+        self._revalidate(ds, changes, referrers)
+        self._publish_data(old_ds, ds, changes)
+        return changes
+
+    def undo(self):
+        return self._step(self.undo_history, self.redo_history)
+
+    def redo(self):
+        return self._step(self.redo_history, self.undo_history)
+
+    def can_undo(self):
+        return len(self.undo_history) > 0
+
+    def can_redo(self):
+        return len(self.redo_history) > 0
+
+    def clear_history(self):
+        self.undo_history = list()
+        self.redo_history = list()
+        self._history_cost = 0
+
+    def _step(self, history, other):
+        if len(history) == 0 or self._transactions > 0:
+            return False
+        ds, cost = history.pop()
+        self._history_cost -= cost
+        current = self.datastores['default']
+        self._set_datastore('default', ds)
+        # Only the changed subtrees are published, as for any other commit
+        changes = self._apply(current, ds)
+        other.append((current, changes.retained))
+        self._history_cost += other[-1][1]
+        self._evict()
+        return True
+
+    def _record(self, old_ds, ds, changes):
+        if len(changes.subtrees()) == 0:
+            # Nothing to undo for a refresh, but the latest undo entry may now be the only one
+            # keeping the replaced values alive
+            self._charge(old_ds, ds)
+            return
+        self.undo_history.append((old_ds, changes.retained))
+        self._history_cost += self.undo_history[-1][1]
+        for ds, cost in self.redo_history:
+            self._history_cost -= cost
+        self.redo_history = list()
+        self._evict()
+
+    def _charge(self, old_ds, ds):
+        # Charges the values of the latest undo entry replaced by a commit that is not recorded
+        if len(self.undo_history) > 0:
+            undo_ds, cost = self.undo_history[-1]
+            released = changeset.compare(old_ds, ds, kept=undo_ds).retained
+            self.undo_history[-1] = (undo_ds, cost + released)
+            self._history_cost += released
+            self._evict()
+
+    def _evict(self):
+        while self._history_cost > self.history_budget and len(self.undo_history) > 0:
+            ds, cost = self.undo_history.pop(0)
+            self._history_cost -= cost
+        while self._history_cost > self.history_budget and len(self.redo_history) > 0:
+            ds, cost = self.redo_history.pop(0)
+            self._history_cost -= cost
+
+    def _set_datastore(self, name, datastore):
+        self.datastores[name] = datastore
+        self.generations[name] = self.generations.get(name, 0) + 1
+
+    def _execute(self, name, run, done=None, failed=None, progress=None):
+        # Without a worker, run synchronously and return the result
+        if self.worker != None:
+            self.worker.submit(name, run, done, failed)
+            return None
+        try:
+            result = run(progress)
+        except Exception as e:
+            if failed == None:
+                raise
+            failed(e)
+            return None
+        if done != None:
+            done(result)
+        return result
         
-    def path_to_topic(self, path, schema_node):
-        topic = '.'.join(list(map(str, path)))
-        if topic == '':
-            topic = 'yang'
-        else:
-            topic = 'yang.{}'.format(topic)
-        if isinstance(schema_node, yangson.schemanode.SequenceNode):
-            topic += '.sequenceNode'
-        elif isinstance(schema_node, yangson.schemanode.InternalNode):
-            topic += '.internalNode'
-        return topic
-
-    def _publish_data(self, old_data, new_data, publish_on_no_data=False):
-        publish = False
-        new_data_valid = (new_data != None)
-        old_data_valid = (old_data != None)
-
-        if new_data_valid:
-            valid_data = new_data
-            pub_data = new_data
-            if old_data_valid:
-                if new_data.value != old_data.value:
-                    publish = True
-                elif isinstance(valid_data.value, yangson.instvalue.StructuredValue):
-                    if new_data.value.timestamp != old_data.value.timestamp:
-                        publish = True
-                elif new_data.timestamp != old_data.timestamp:
-                    publish = True
-            else:
-                publish = True
-        elif old_data_valid:
-            pub_data = None
-            valid_data = old_data
-            publish = True
-
-        if publish:
-            topic = self.path_to_topic(valid_data.path, valid_data.schema_node)
-            pub.sendMessage(topic, data=pub_data)
-            if isinstance(valid_data.value, yangson.instvalue.ArrayValue):
-                old_len = 0
-                new_len = 0
-                if old_data_valid:
-                    old_len = len(old_data.value)
-                if new_data_valid:
-                    new_len = len(new_data.value)
-                length = max(old_len, new_len)
-                for idx in range(length):
-                    old_entry = None
-                    if idx < old_len:
-                        old_entry = old_data[idx]
-                    new_entry = None
-                    if idx < new_len:
-                        new_entry = new_data[idx]
-                    self._publish_data(old_entry, new_entry, publish_on_no_data)
-            elif isinstance(valid_data.value, yangson.instvalue.StructuredValue):
-                keys = list()
-                if new_data_valid:
-                    keys = list(new_data.value.keys())
-                if old_data_valid:
-                    keys = keys + list(old_data.value.keys())
-                keys = list(set(keys))
-                for iname in keys:
-                    old_child = None
-                    new_child = None
-                    if old_data_valid and iname in old_data:
-                        old_child = old_data[iname]
-                    if new_data_valid and iname in new_data:
-                        new_child = new_data[iname]
-                    self._publish_data(old_child, new_child, publish_on_no_data)
+    def subscribe(self, path, listener):
+        # listener(data) is called with the instance node at path whenever it changes,
+        # or with None when it is removed
+        self.dispatcher.subscribe(path, listener)
+
+    def unsubscribe(self, path, listener):
+        self.dispatcher.unsubscribe(path, listener)
+
+    def _publish_data(self, old_data, new_data, changes):
+        def resolve(path, removed):
+            return self.get_resource(path, root=old_data if removed else new_data)
+        self.dispatcher.dispatch(changes, resolve)
+        for cb in self.change_callbacks:
+            cb(changes)
+
+    def register_change_cb(self, callback):
+        self.change_callbacks.append(callback)
 
     def register_error_log_cb(self, callback):
         self.error_log_callbacks.append(callback)
         
-    def _find_all_errors(self, node):
-        if isinstance(node, yangson.instance.RootNode):
-            self.errorLog = list()  # empty the error log
-        self._validate_node(node)
-        if isinstance(node.value, yangson.instvalue.ObjectValue):
-            for item in node.value:
-                self._find_all_errors(node[item])
-        elif isinstance(node.value, yangson.instvalue.ArrayValue):
-            for entry in node:
-                self._find_all_errors(entry)
-        
-        if isinstance(node, yangson.instance.RootNode):
-            self._removeDuplicates()
-            self.errorLog = list(set(self.errorLog))
-            self.errorLog = sorted(self.errorLog , key=lambda log: log.instance.path)
-            self._notify_error_log_cbs()
-            
-    def _removeDuplicates(self):
-        errorLogClean = list()
-        for error in self.errorLog:
-            seen = False
-            for errorClean in errorLogClean:
-                if str(error) == str(errorClean):
-                    seen = True
-                    break
-            if not seen:
-                errorLogClean.append(error)
-        self.errorLog = errorLogClean
-            
+    def _revalidate_all(self, root):
+        def run(progress):
+            self._errors = ErrorStore()
+            self.validator.validate(root, self._errors)
+            return self._published_errors()
+        self._execute('Validating', run, self._set_error_log)
+
+    def _revalidate(self, root, changes, referrers=None):
+        # referrers are the paths of the indexed leafrefs whose targets changed, None if unknown
+        changed = changes.subtrees()
+        indexed = self._leafref_index.leafrefs if referrers != None else ()
+        if () in changed:
+            self._revalidate_all(root)
+            return
+        if len(changed) == 0:
+            return
+        def run(progress):
+            for path in changed:
+                self._errors.remove_subtree(path)
+            validated = set()
+            for path in changed:
+                node = self.get_resource(path, root=root)
+                if node != None:
+                    self.validator.validate(node, self._errors)
+                # The checks of all ancestors may depend on the changed subtree
+                for idx in range(len(path)):
+                    if not path[:idx] in validated:
+                        validated.add(path[:idx])
+                        self.validator.validate_node(self.get_resource(path[:idx], root=root), self._errors)
+            # So may the must, when and leafref expressions referring to it
+            self.validator.validate_dependents(root, changed, self._errors, skip=validated, indexed=indexed)
+            for path in sorted(referrers or ()):
+                if not path in validated and not any(path[:len(p)] == p for p in changed):
+                    self.validator.validate_node(self.get_resource(path, root=root), self._errors)
+            return self._published_errors()
+        self._execute('Validating', run, self._set_error_log)
+
+    def _published_errors(self):
+        if self.worker != None:
+            return self._errors.copy()
+        return self._errors
+
+    def _set_error_log(self, errors):
+        self.errorLog = errors
+        self._notify_error_log_cbs()
+
     def _notify_error_log_cbs(self):
         for cb in self.error_log_callbacks:
             cb()
 
-    def _validate_node(self, inst):
-        try:
-            inst.validate(ctype=yangson.enumerations.ContentType.all)
-        except yangson.exceptions.YangsonException as e:
-            self._log_error(e)
-
-    def _log_error(self, e):
-        self.errorLog.append(e)
-
-    def diff(self, name1='load', name2='default'):
-        inst_raw1 = self.get_resource(name=name1).raw_value()
-        inst_raw2 = self.get_resource(name=name2).raw_value()
-        
-        lines1 = json.dumps(inst_raw1, indent=4).split('\n')
-        lines2 = json.dumps(inst_raw2, indent=4).split('\n')
-        differ = difflib.HtmlDiff()
-        diff = differ.make_file(lines1, lines2, context=True)
-        return diff
+    def diff(self, name1='load', name2='default', done=None, format='html'):
+        # format is one of 'html', 'json-patch' (RFC 6902) or 'yang-patch' (RFC 8072)
+        root1 = self.get_resource(name=name1)
+        root2 = self.get_resource(name=name2)
+        def run(progress):
+            edits = datadiff.compare(root1, root2)
+            if format == 'json-patch':
+                return json.dumps(datadiff.to_json_patch(edits), indent=4)
+            elif format == 'yang-patch':
+                return json.dumps(datadiff.to_yang_patch(edits), indent=4)
+            return datadiff.to_html(edits)
+        return self._execute('Comparing data', run, done)
     
-    def get_resource(self, path=(), name='default'):
+    def leafref_index(self):
+        # Index of the leafref targets and leafrefs in the default datastore
+        if self._leafref_index == None:
+            self._leafref_index = LeafrefIndex(self.dm.schema)
+        root = self.datastores.get('default')
+        if not self._leafref_index.root is root:
+            self._leafref_index.build(root)
+        return self._leafref_index
+
+    def get_resource(self, path=(), name='default', root=None):
+        path = tuple(path)
+        if root != None:
+            return resolve(root, path)
         if not name in self.datastores:
             return None
-        d = self.datastores[name]
-        for index in path:
-            if d == None:
-                return None
-            if isinstance(d.value, yangson.instvalue.ArrayValue):
-                if 0 <= index < len(d.value):
-                    d = d[index]
-                else:
-                    return None
-            elif index in d:
-                d = d[index]
+        generation, cache = self._resource_cache.get(name, (None, None))
+        if generation != self.generations[name] or len(cache) > self.RESOURCE_CACHE_SIZE:
+            cache = {(): self.datastores[name]}
+            self._resource_cache[name] = (self.generations[name], cache)
+        if path in cache:
+            return cache[path]
+        # Continue from the nearest resolved ancestor, e.g. the list for the cells of its entries.
+        # List entries and the nodes below them are not cached, as an entry keeps copies of
+        # all its siblings once they are used.
+        idx = len(path) - 1
+        while not path[:idx] in cache:
+            idx -= 1
+        d = cache[path[:idx]]
+        for idx in range(idx, len(path)):
+            if isinstance(path[idx], int):
+                return resolve(d, path[idx:])
+            d = resolve(d, path[idx:idx + 1])
+            cache[path[:idx + 1]] = d
+        return d
+
+def resolve(d, path):
+    # The instance node at path below d, or None. List entries are LazyArrayEntry nodes, which
+    # do not copy their siblings.
+    for index in path:
+        if d == None:
+            return None
+        if isinstance(d.value, yangson.instvalue.ArrayValue):
+            if 0 <= index < len(d.value):
+                d = LazyArrayEntry(index, d.value, d, d.schema_node, d.value.timestamp)
             else:
                 return None
-        return d
\ No newline at end of file
+        elif index in d:
+            d = d[index]
+        else:
+            return None
+    return d
@@ -13,8 +13,8 @@ class ErrorLog(wx.ListCtrl):
         self.dsrepo = None
         self.columns = ['path', 'type', 'tag', 'message']
         self.sizer = wx.BoxSizer(wx.VERTICAL)
-        st = wx.StaticText(parent, label='YANG Instance Data Errors')
-        self.sizer.Add(st)
+        self.heading = wx.StaticText(parent, label='YANG Instance Data Errors')
+        self.sizer.Add(self.heading)
         self.sizer.Add(self, 1, wx.EXPAND)
         parent.SetSizerAndFit(self.sizer)
         for col, heading in enumerate(self.columns):
@@ -28,10 +28,20 @@ class ErrorLog(wx.ListCtrl):
     def NotifyErrorLogChange(self):
         n_errors = len(self.dsrepo.errorLog)
         self.SetItemCount(n_errors)
+        self.heading.SetLabel(self._GetHeading())
         if n_errors > 0:
+            self.RefreshItems(0, n_errors - 1)
             for col in range(0, len(self.columns)):
                 self.SetColumnWidth(col, wx.LIST_AUTOSIZE)
 
+    def _GetHeading(self):
+        heading = 'YANG Instance Data Errors'
+        counts = self.dsrepo.errorLog.counts_by_tag()
+        if len(counts) > 0:
+            tags = ['{}: {}'.format(tag, counts[tag]) for tag in sorted(counts)]
+            heading = '{} ({})'.format(heading, ', '.join(tags))
+        return heading
+
     def OnGetItemText(self, item, column):
         val = ''
         if self.dsrepo != None:
@@ -0,0 +1,100 @@
+# Copyright 2020-2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+import bisect
+
+class ErrorStore:
+    def __init__(self):
+        self._errors = dict()   # (json pointer, tag, message) -> error
+        self._origins = dict()  # (json pointer, tag, message) -> paths of the validated nodes that raised it
+        self._by_origin = dict() # path of validated node -> (json pointer, tag, message)
+        self._order = list()    # sorted (instance path, key) of all errors
+        self._tags = dict()     # tag -> number of errors
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, index):
+        return self._errors[self._order[index][1]]
+
+    def __iter__(self):
+        for path, key in self._order:
+            yield self._errors[key]
+
+    def key(self, error):
+        return (error.instance.json_pointer(), str(error.tag), str(error.message))
+
+    def clear(self):
+        self.__init__()
+
+    def copy(self):
+        other = ErrorStore()
+        other._errors = dict(self._errors)
+        other._origins = {key: set(origins) for key, origins in self._origins.items()}
+        other._by_origin = dict(self._by_origin)
+        other._order = list(self._order)
+        other._tags = dict(self._tags)
+        return other
+
+    def insert(self, origin, error):
+        key = self.key(error)
+        if self._by_origin.get(origin) == key:
+            return
+        self.remove(origin)
+        self._by_origin[origin] = key
+        if key in self._errors:
+            self._origins[key].add(origin)
+            return
+        self._errors[key] = error
+        self._origins[key] = set([origin])
+        bisect.insort(self._order, (error.instance.path, key))
+        self._count_tag(key[1], 1)
+
+    def remove(self, origin):
+        key = self._by_origin.pop(origin, None)
+        if key != None:
+            self._origins[key].discard(origin)
+            if len(self._origins[key]) == 0:
+                self._drop(key)
+
+    def remove_subtree(self, path):
+        start, end = self._range(path)
+        for location, key in self._order[start:end]:
+            for origin in self._origins.pop(key):
+                del self._by_origin[origin]
+            del self._errors[key]
+            self._count_tag(key[1], -1)
+        del self._order[start:end]
+
+    def under(self, path):
+        start, end = self._range(path)
+        return [self._errors[key] for location, key in self._order[start:end]]
+
+    def count(self, tag=None):
+        if tag == None:
+            return len(self._order)
+        return self._tags.get(tag, 0)
+
+    def counts_by_tag(self):
+        return dict(self._tags)
+
+    def _range(self, path):
+        # All paths starting with path sort directly after it
+        start = bisect.bisect_left(self._order, (path, ))
+        end = start
+        while end < len(self._order) and self._order[end][0][:len(path)] == path:
+            end += 1
+        return start, end
+
+    def _drop(self, key):
+        error = self._errors.pop(key)
+        del self._origins[key]
+        idx = bisect.bisect_left(self._order, (error.instance.path, key))
+        del self._order[idx]
+        self._count_tag(key[1], -1)
+
+    def _count_tag(self, tag, delta):
+        self._tags[tag] = self._tags.get(tag, 0) + delta
+        if self._tags[tag] == 0:
+            del self._tags[tag]
@@ -2,27 +2,56 @@
 #
 # SPDX-License-Identifier: LGPL-3.0-or-later
 
+import colorsys
+
+import numpy
 import wx
 from wx.lib.plot import PlotCanvas, PlotGraphics, PolyLine
-from pubsub import pub
+
+from .aggregators import SeriesStatistics, counter_modulus
+from .pollscheduler import PollScheduler
+from .recorder import Recorder
+from .timeseries import RingBuffer, MinMaxDownsampler
 
 class GraphViewer(wx.Panel):
-    def __init__(self, parent, dsrepo, sbif):
-        self.reset()
+    def __init__(self, parent, dsrepo, southbound, coalescer=None):
         self.dsrepo = dsrepo
-        self.sbif = sbif
+        self.southbound = southbound
+        self.coalescer = coalescer
+        self.recorder = None
         super().__init__(parent, -1)
-        sizer = wx.BoxSizer(wx.VERTICAL)
-        self.canvas = PlotCanvas(self)
-        sizer.Add(self.canvas, 1, wx.EXPAND)
+        sizer = wx.BoxSizer(wx.HORIZONTAL)
+        # Series can be hidden from the graphs, their samples are still recorded
+        self.seriesList = wx.CheckListBox(self)
+        self.seriesList.Bind(wx.EVT_CHECKLISTBOX, self.OnSeriesChecked)
+        self.seriesList.Bind(wx.EVT_CONTEXT_MENU, self.OnSeriesContextMenu)
+        sizer.Add(self.seriesList, 0, wx.EXPAND)
+        # One plot canvas per group of series, stacked in a scrolled window
+        self.panelWindow = wx.ScrolledWindow(self)
+        self.panelWindow.SetScrollRate(0, 20)
+        self.panelWindow.SetSizer(wx.BoxSizer(wx.VERTICAL))
+        sizer.Add(self.panelWindow, 1, wx.EXPAND)
         self.SetSizerAndFit(sizer)
-        self.canvas.enableLegend = True
+        self.panels = dict() # group -> PlotCanvas
+        self.panel_height = 250
+        self.max_legend = 12 # panels with more visible series are drawn without legend
+        self.statistics_window = 60 # [s] of the rolling min, max, mean and p95
+        self.line_styles = {
+            'value': wx.PENSTYLE_SOLID,
+            'delta': wx.PENSTYLE_SOLID,
+            'rate': wx.PENSTYLE_SOLID,
+            'min': wx.PENSTYLE_DOT,
+            'max': wx.PENSTYLE_DOT,
+            'mean': wx.PENSTYLE_SHORT_DASH,
+            'p95': wx.PENSTYLE_LONG_DASH
+        }
+        self.reset()
         self.Layout()
-        
+
         self.timer = wx.Timer(self)
-        self.timer.Start(milliseconds=self.interval)
+        self.timer.Start(milliseconds=self.resolution)
         self.Bind(wx.EVT_TIMER, self.get_loop)
-        
+
         self.colors = [
             [166,206,227],
             [31,120,180],
@@ -39,12 +68,26 @@ class GraphViewer(wx.Panel):
         ]
 
     def reset(self):
-        self.datasources = list()
-        self.interval = 1000 # in ms
-        self.max_samples = 100 # to ensure stability, only plot a maximum of this number of samples
-        self.max_age = self.interval * self.max_samples / 1000 # [s] if data points are older than this, drop them
+        self.datasources = dict() # path -> data source
+        self.groups = dict() # group -> {path: data source} of the plotted data sources
+        self.interval = 1000 # in ms, default polling interval
+        self.resolution = 100 # in ms, polling timer
+        self.scheduler = PollScheduler(self.southbound, self.dsrepo, default_interval=self.interval / 1000)
+        self.max_samples = 100000 # samples kept at most per data source, the buffers grow up to it
+        self.max_age = 3600 # [s] only samples within this time window are plotted and kept
         self.latest_sample = 0
         self.time_base = 0
+        self.color_count = 0
+        self.dirty = set() # groups to be redrawn
+        for canvas in self.panels.values():
+            canvas.Destroy()
+        self.panels = dict()
+        self.seriesList.Clear()
+        self.series_paths = list() # path of each item in the series list
+
+    def set_dsrepo(self, dsrepo):
+        self.dsrepo = dsrepo
+        self.scheduler.dsrepo = dsrepo
 
     def set_editor(self, editor):
         self.editor = editor
@@ -57,86 +100,278 @@ class GraphViewer(wx.Panel):
             self.set_time_base(data.timestamp.timestamp())
         return data.timestamp.timestamp() - self.time_base
 
+    def get_color(self, idx):
+        # The fixed colors first, then hues spread by the golden ratio in alternating shades
+        if idx < len(self.colors):
+            return wx.Colour(*self.colors[idx])
+        idx -= len(self.colors)
+        hue = (idx * 0.618033988749895) % 1
+        saturation, value = [(0.9, 0.85), (0.6, 0.95), (0.9, 0.55)][idx % 3]
+        return wx.Colour(*[int(c * 255) for c in colorsys.hsv_to_rgb(hue, saturation, value)])
+
     def value_change_cb(self, data):
-        for plot in self.datasources:
-            if plot['path'] == data.path:
-                plot['data'].append((self.get_timestamp(data), data.value))
-                if self.get_timestamp(data) > self.latest_sample:
-                    self.latest_sample = self.get_timestamp(data)
-                break
-        self.canvas.Draw(self.draw())
-        
-    def add(self, path, topic, plot=True, loop=False):
-        entry_updated = False
-        for d in self.datasources:
-            if d['path'] == path:
-                if loop:
-                    d['loop'] = loop
-                if plot:
-                    d['plot'] = plot
-                entry_updated = True
-        if not entry_updated:
+        if data == None:
+            return
+        plot = self.datasources.get(data.path)
+        if plot == None:
+            return
+        try:
+            value = float(data.value)
+        except (TypeError, ValueError):
+            return # not a numeric value
+        timestamp = self.get_timestamp(data)
+        if len(plot['data']) > 0 and timestamp < plot['data'].last_time():
+            return # the samples of a series must be in time order
+        plot['data'].append(timestamp, value)
+        if plot['statistics'] == None:
+            plot['statistics'] = SeriesStatistics(counter_modulus(data.schema_node), self.statistics_window)
+            self._update_derived(plot)
+        # Counters are passed as integers, floats lose the low bits of 64 bit counters
+        results = plot['statistics'].update(timestamp, data.value if plot['statistics'].is_counter() else value)
+        for kind, line in plot['derived'].items():
+            if kind in results:
+                line['data'].append(timestamp, results[kind])
+        if self.recorder != None:
+            self.recorder.append(data.timestamp.timestamp(), data.path, value)
+        if timestamp > self.latest_sample:
+            self.latest_sample = timestamp
+        self._discard_old(plot)
+        if not plot['visible']:
+            return
+        self.dirty.add(plot['group'])
+        # All samples are kept, but the canvas is only redrawn a few times per second
+        if self.coalescer != None:
+            self.coalescer.schedule(id(self), self.redraw)
+        else:
+            self.redraw()
+
+    def start_recording(self, directory):
+        # Samples of all plotted series are appended to the recording, hidden ones included
+        self.stop_recording()
+        self.recorder = Recorder(directory)
+
+    def stop_recording(self):
+        if self.recorder != None:
+            self.recorder.close()
+            self.recorder = None
+
+    def is_recording(self):
+        return self.recorder != None
+
+    def load_recording(self, directory, t_min=None, t_max=None):
+        # Plots the recorded series, t_min and t_max are absolute timestamps
+        recording = Recorder(directory, readonly=True)
+        time_range = recording.time_range()
+        if time_range == None:
+            return
+        if self.time_base == 0:
+            self.set_time_base(time_range[0])
+        for path, series_times, series_values in recording.series_by_path(t_min, t_max):
+            self.add(path)
+            plot = self.datasources[path]
+            series_times = series_times - self.time_base
+            if len(plot['data']) > 0:
+                # Samples already in the graph are kept, the series must stay in time order
+                first = numpy.searchsorted(series_times, plot['data'].last_time(), side='right')
+                series_times = series_times[first:]
+                series_values = series_values[first:]
+            if len(series_times) == 0:
+                continue
+            plot['data'].extend(series_times, series_values)
+            self.latest_sample = max(self.latest_sample, series_times[-1])
+            self.dirty.add(plot['group'])
+        for plot in self.datasources.values():
+            self._discard_old(plot)
+        self.redraw()
+
+    def _discard_old(self, plot):
+        # Samples older than the plotted window are dropped, a recording keeps them if needed
+        t_min = self.latest_sample - self.max_age
+        plot['data'].discard(t_min)
+        for line in plot['derived'].values():
+            line['data'].discard(t_min)
+
+    def redraw(self):
+        dirty, self.dirty = self.dirty, set()
+        for group in dirty:
+            if group in self.panels:
+                self.panels[group].Draw(self.draw(group))
+
+    def add(self, path, plot=True, loop=False, interval=None, group=None):
+        # interval [s] of the GET loop, if enabled
+        # Series are grouped by the name of the leaf by default, e.g. one panel per counter
+        d = self.datasources.get(path)
+        if d == None:
             d = {
-                'topic': topic,
                 'path': path,
-                'loop': loop,
-                'data': [],
+                'loop': False,
+                'data': RingBuffer(self.max_samples),
+                'sampler': MinMaxDownsampler(),
                 'line': None,
                 'legend': str(path),
-                'plot': plot
+                'plot': False,
+                'visible': True,
+                'lines': None,          # kinds of lines drawn, None for the default of the leaf
+                'statistics': None,     # created with the first sample, when the leaf type is known
+                'derived': dict(),      # kind -> RingBuffer and sampler of a derived line
+                'group': group if group != None else str(path[-1]),
+                'color': self.get_color(self.color_count)
             }
-            self.datasources.append(d)
-        if plot:
-            pub.subscribe(self.value_change_cb, d['topic'])
-            self.canvas.Draw(self.draw())
-        
-    def remove(self, topic):
-        for idx, plot in enumerate(self.datasources):
-            if plot['topic'] == topic:
-                deleteIdx = idx
-        pub.unsubscribe(self.value_change_cb, topic)
-        del self.datasources[deleteIdx]
-
-    def draw(self):
-        plots = []
-        styleIdx = 0
-        for plot in self.datasources:
-            plot['data'] = [p for p in plot['data'] if p[0] > (self.latest_sample - self.max_age)]
-            if plot['plot'] == True:
-                color = wx.Colour(self.colors[styleIdx][0], self.colors[styleIdx][1], self.colors[styleIdx][2])
-                styleIdx += 1
-                plot['line'] = PolyLine(plot['data'], legend=plot['legend'], colour=color, width=3)
-                plots.append(plot['line'])
-        return PlotGraphics(plots, '', 'time [s]', '')
-    
-    def is_in_graph(self, topic):
-        for d in self.datasources:
-            if d['topic'] == topic:
-                if d['plot']:
-                    return True
-                else:
-                    break
-        return False
-    
-    def is_in_loop(self, topic):
-        for d in self.datasources:
-            if d['topic'] == topic:
-                if d['loop']:
-                    return True
+            self.color_count += 1
+            self.datasources[path] = d
+        if loop:
+            d['loop'] = loop
+            self.scheduler.add(path, interval)
+        if plot and not d['plot']:
+            d['plot'] = plot
+            self.groups.setdefault(d['group'], dict())[path] = d
+            self.series_paths.append(path)
+            self.seriesList.Check(self.seriesList.Append(d['legend']), d['visible'])
+            self.dsrepo.subscribe(path, self.value_change_cb)
+            self._update_panel(d['group'])
+
+    def remove(self, path):
+        d = self.datasources.pop(path, None)
+        self.dsrepo.unsubscribe(path, self.value_change_cb)
+        self.scheduler.remove(path)
+        if d != None and d['plot']:
+            del self.groups[d['group']][path]
+            if len(self.groups[d['group']]) == 0:
+                del self.groups[d['group']]
+            idx = self.series_paths.index(path)
+            del self.series_paths[idx]
+            self.seriesList.Delete(idx)
+            self._update_panel(d['group'])
+
+    def set_visible(self, path, visible):
+        d = self.datasources.get(path)
+        if d == None or d['visible'] == visible:
+            return
+        d['visible'] = visible
+        if d['plot']:
+            self.seriesList.Check(self.series_paths.index(path), visible)
+            self._update_panel(d['group'])
+
+    def set_group_visible(self, group, visible):
+        for path in list(self.groups.get(group, dict())):
+            self.set_visible(path, visible)
+
+    def is_visible(self, path):
+        d = self.datasources.get(path)
+        return d != None and d['visible']
+
+    def get_lines(self, path):
+        # Counters show their rate by default, as their raw value is meaningless in a graph
+        d = self.datasources[path]
+        if d['lines'] != None:
+            return d['lines']
+        if d['statistics'] != None and d['statistics'].is_counter():
+            return ('rate', )
+        return ('value', )
+
+    def set_lines(self, path, kinds):
+        # kinds are 'value' and the kinds of SeriesStatistics, derived lines start empty
+        d = self.datasources.get(path)
+        if d == None:
+            return
+        d['lines'] = tuple(kinds)
+        self._update_derived(d)
+        if d['plot']:
+            self._update_panel(d['group'])
+
+    def _update_derived(self, d):
+        kinds = self.get_lines(d['path'])
+        for kind in list(d['derived']):
+            if not kind in kinds:
+                del d['derived'][kind]
+        for kind in kinds:
+            if kind != 'value' and not kind in d['derived']:
+                d['derived'][kind] = {'data': RingBuffer(self.max_samples), 'sampler': MinMaxDownsampler()}
+
+    def OnSeriesContextMenu(self, e):
+        idx = self.seriesList.HitTest(self.seriesList.ScreenToClient(e.GetPosition()))
+        if idx == wx.NOT_FOUND:
+            return
+        path = self.series_paths[idx]
+        lines = self.get_lines(path)
+        menu = wx.Menu()
+        for kind in ('value', ) + SeriesStatistics.kinds:
+            item = menu.AppendCheckItem(wx.ID_ANY, kind)
+            item.Check(kind in lines)
+            def toggle(e, kind=kind):
+                kinds = [k for k in self.get_lines(path) if k != kind]
+                if e.IsChecked():
+                    kinds.append(kind)
+                self.set_lines(path, kinds)
+            menu.Bind(wx.EVT_MENU, toggle, item)
+        self.seriesList.PopupMenu(menu)
+        menu.Destroy()
+
+    def OnSeriesChecked(self, e):
+        idx = e.GetInt()
+        self.set_visible(self.series_paths[idx], self.seriesList.IsChecked(idx))
+
+    def _update_panel(self, group):
+        # Only groups with visible series get a panel
+        shown = any(d['visible'] for d in self.groups.get(group, dict()).values())
+        if shown and not group in self.panels:
+            canvas = PlotCanvas(self.panelWindow)
+            canvas.SetMinSize((-1, self.panel_height))
+            self.panelWindow.GetSizer().Add(canvas, 0, wx.EXPAND)
+            self.panels[group] = canvas
+            self.panelWindow.FitInside()
+            self.panelWindow.Layout()
+        elif not shown and group in self.panels:
+            self.panels.pop(group).Destroy()
+            self.panelWindow.FitInside()
+            self.panelWindow.Layout()
+        self.dirty.add(group)
+        self.redraw()
+
+    def draw(self, group):
+        canvas = self.panels[group]
+        t_min = self.latest_sample - self.max_age
+        lines = list()
+        for plot in self.groups[group].values():
+            if not plot['visible']:
+                continue
+            for kind in self.get_lines(plot['path']):
+                if kind == 'value':
+                    lines.append((plot, plot, plot['legend'], kind))
                 else:
-                    break
-        return False
-    
-    def remove_from_data_loop(self, topic):
-        for idx, d in enumerate(self.datasources):
-            if d['topic'] == topic:
-                self.datasources[idx]['loop'] = False
-    
+                    lines.append((plot, plot['derived'][kind], '{} {}'.format(plot['legend'], kind), kind))
+        # Series are reduced to the min and max per pixel column before they are handed to PolyLine.
+        # The canvas scales to the time span of the samples plotted, and the bucket width is rounded
+        # down to a power of two, so that the cached buckets stay valid while the span grows.
+        windows = [line['data'].window(t_min)[0] for plot, line, legend, kind in lines]
+        windows = [times for times in windows if len(times) > 0]
+        span = 0
+        if len(windows) > 0:
+            span = max(times[-1] for times in windows) - min(times[0] for times in windows)
+        bucket_width = 1.0
+        if span > 0:
+            bucket_width = 2.0 ** numpy.floor(numpy.log2(span / max(1, canvas.GetClientSize().width)))
+        plots = []
+        for plot, line, legend, kind in lines:
+            points = line['sampler'].points(line['data'], t_min, bucket_width)
+            line['line'] = PolyLine(points, legend=legend, colour=plot['color'], width=3, style=self.line_styles[kind])
+            plots.append(line['line'])
+        canvas.enableLegend = len(plots) <= self.max_legend
+        return PlotGraphics(plots, group, 'time [s]', '')
+
+    def is_in_graph(self, path):
+        d = self.datasources.get(path)
+        return d != None and d['plot'] == True
+
+    def is_in_loop(self, path):
+        d = self.datasources.get(path)
+        return d != None and d['loop'] == True
+
+    def remove_from_data_loop(self, path):
+        d = self.datasources.get(path)
+        if d != None:
+            d['loop'] = False
+        self.scheduler.remove(path)
+
     def get_loop(self, e):
-        for d in self.datasources:       
-            if d['loop']:
-                if self.sbif != None:
-                    data = self.dsrepo.get_resource(d['path'])
-                    data = self.sbif.get(self.dsrepo.dm, data, d['path'])
-                    if data != None:
-                        self.dsrepo.commit(data.top())
+        self.scheduler.poll()
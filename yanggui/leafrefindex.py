@@ -0,0 +1,207 @@
+# Copyright 2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+import yangson
+
+class LeafrefIndex:
+    # Instance paths and canonical values of all leafref targets and leafrefs in the
+    # instance data, keyed by the data path of the target schema node. Leafrefs with
+    # predicates in their path can only be resolved by evaluating it, and are not indexed.
+    def __init__(self, schema):
+        self.schema = schema
+        self.root = None            # instance data the index reflects
+        self.leafrefs = dict()      # leafref schema node -> (target key, scope depth)
+        self.target_nodes = dict()  # target schema node -> target key
+        self.targets = dict()       # target key -> {instance path: value}
+        self.target_values = dict() # target key -> {value: set of instance paths}
+        self.references = dict()    # target key -> {instance path: (value, scope)}
+        self.reference_values = dict() # target key -> {value: set of instance paths}
+        self.versions = dict()      # target key -> number of changes of its targets
+        self._choices = dict()      # (target key, scope) -> (version, choices)
+        self._relevant = set()      # schema nodes with indexed nodes in their subtree
+        self._touched = set()       # (target key, value) of the targets changed by an update
+        self._collect(schema)
+        for target in self.target_nodes:
+            while target != None and not target in self._relevant:
+                self._relevant.add(target)
+                target = target.parent
+
+    def build(self, root):
+        for key in self.versions:
+            self.targets[key] = dict()
+            self.target_values[key] = dict()
+            self.references[key] = dict()
+            self.reference_values[key] = dict()
+            self.versions[key] += 1
+        self.root = root
+        if root != None:
+            self._scan(root.value, self.schema, (), self._add)
+        self._touched = set()
+
+    def update(self, old_root, new_root, changes):
+        # Only the changed subtrees are scanned, in the old data to drop their entries and
+        # in the new data to add them again. Returns the instance paths of the leafrefs whose
+        # targets changed, or None if the index was rebuilt.
+        if self.root is not old_root:
+            self.build(new_root)
+            return None
+        self.root = new_root
+        self._touched = set()
+        for path in changes.subtrees():
+            if path == ():
+                self.build(new_root)
+                return None
+            for root, callback in ((old_root, self._remove), (new_root, self._add)):
+                value, sn = _locate(root.value, self.schema, path)
+                if sn in self._relevant:
+                    self._scan(value, sn, path, callback)
+        referrers = set()
+        for key, value in self._touched:
+            referrers.update(self.reference_values[key].get(value, ()))
+        self._touched = set()
+        return referrers
+
+    def is_indexed(self, sn):
+        return sn in self.leafrefs
+
+    def choices(self, sn, path):
+        # Canonical values of the targets of the leafref sn at path, in document order, or
+        # None if the leafref is not indexed. The lists are cached until a target changes.
+        if not sn in self.leafrefs:
+            return None
+        key, depth = self.leafrefs[sn]
+        scope = _scope(path, depth)
+        version, choices = self._choices.get((key, scope), (None, None))
+        if version != self.versions[key]:
+            targets = self.targets[key]
+            choices = [targets[p] for p in sorted(targets) if p[:len(scope)] == scope]
+            self._choices[(key, scope)] = (self.versions[key], choices)
+        return choices
+
+    def referrers(self, path):
+        # Instance paths of the leafrefs referring to the target at path
+        referrers = list()
+        for key, targets in self.targets.items():
+            if path in targets:
+                for ref in self.reference_values[key].get(targets[path], ()):
+                    scope = self.references[key][ref][1]
+                    if path[:len(scope)] == scope:
+                        referrers.append(ref)
+        return sorted(referrers)
+
+    def dangling(self):
+        # Instance paths of the leafrefs without a target
+        dangling = list()
+        for key, references in self.references.items():
+            for ref, (value, scope) in references.items():
+                if not any(p[:len(scope)] == scope for p in self.target_values[key].get(value, ())):
+                    dangling.append(ref)
+        return sorted(dangling)
+
+    def _collect(self, sn):
+        relevant = False
+        for child in getattr(sn, 'children', ()):
+            relevant = self._collect(child) or relevant
+        if isinstance(sn, yangson.schemanode.TerminalNode) and isinstance(sn.type, yangson.datatype.LeafrefType):
+            target = sn._follow_leafref(sn.type.path, sn)
+            if target != None and not _has_predicates(sn.type.path):
+                key = target.data_path()
+                self.target_nodes[target] = key
+                self.leafrefs[sn] = (key, _depth(_scope_node(sn, sn.type.path)))
+                self.versions.setdefault(key, 0)
+                relevant = True
+        if relevant:
+            self._relevant.add(sn)
+        return relevant
+
+    def _scan(self, value, sn, path, callback):
+        if isinstance(value, yangson.instvalue.ArrayValue):
+            for idx, entry in enumerate(value):
+                self._scan(entry, sn, path + (idx, ), callback)
+        elif isinstance(value, yangson.instvalue.ObjectValue):
+            for name in value:
+                if name[0] == '@':
+                    continue
+                child = sn.get_data_child(*sn._iname2qname(name))
+                if child in self._relevant:
+                    self._scan(value[name], child, path + (name, ), callback)
+        else:
+            if sn in self.target_nodes:
+                callback(self.targets, self.target_values, self.target_nodes[sn], path, sn.type.canonical_string(value))
+            if sn in self.leafrefs:
+                key, depth = self.leafrefs[sn]
+                callback(self.references, self.reference_values, key, path, (sn.type.canonical_string(value), _scope(path, depth)))
+
+    def _add(self, entries, values, key, path, entry):
+        entries[key][path] = entry
+        values[key].setdefault(_value(entry), set()).add(path)
+        if entries is self.targets:
+            self.versions[key] += 1
+            self._touched.add((key, entry))
+
+    def _remove(self, entries, values, key, path, entry):
+        entries[key].pop(path, None)
+        paths = values[key].get(_value(entry))
+        if paths != None:
+            paths.discard(path)
+            if len(paths) == 0:
+                del values[key][_value(entry)]
+        if entries is self.targets:
+            self.versions[key] += 1
+            self._touched.add((key, entry))
+
+def _value(entry):
+    return entry[0] if isinstance(entry, tuple) else entry
+
+def _has_predicates(expr):
+    if isinstance(expr, yangson.xpathast.Step):
+        return len(expr.predicates) > 0
+    if isinstance(expr, yangson.xpathast.LocationPath):
+        return _has_predicates(expr.left) or _has_predicates(expr.right)
+    return not isinstance(expr, yangson.xpathast.Root)
+
+def _steps(expr):
+    if isinstance(expr, yangson.xpathast.LocationPath):
+        return _steps(expr.left) + _steps(expr.right)
+    return [expr]
+
+def _scope_node(sn, expr):
+    # The schema node reached by the parent steps at the start of a relative path, i.e. the
+    # node whose instance contains all targets of one leafref instance
+    for step in _steps(expr):
+        if isinstance(step, yangson.xpathast.Root):
+            return None
+        if not isinstance(step, yangson.xpathast.Step) or step.axis != yangson.xpathast.Axis.parent:
+            break
+        sn = sn.data_parent()
+    return sn
+
+def _depth(sn):
+    depth = 0
+    while sn != None and not isinstance(sn, yangson.schemanode.SchemaTreeNode):
+        depth += 1
+        sn = sn.data_parent()
+    return depth
+
+def _scope(path, depth):
+    # Prefix of the instance path down to the data node at the given schema depth
+    idx = 0
+    while depth > 0:
+        if not isinstance(path[idx], int):
+            depth -= 1
+        idx += 1
+    if idx < len(path) and isinstance(path[idx], int):
+        idx += 1   # the list entry
+    return path[:idx]
+
+def _locate(value, sn, path):
+    # The value and schema node at path, or None for both if the path does not exist
+    try:
+        for key in path:
+            value = value[key]
+            if not isinstance(key, int):
+                sn = sn.get_data_child(*sn._iname2qname(key))
+    except (KeyError, IndexError):
+        return None, None
+    return value, sn
@@ -0,0 +1,76 @@
+# Copyright 2020-2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+
+import yangson
+
+from importlib_metadata import version
+
+def load_data_model(library_file, includes, cache_dir):
+    # Returns the data model compiled from the YANG library, reusing the pickled
+    # data model from an earlier run as long as none of the YANG modules changed
+    cache_file = os.path.join(cache_dir, '{}.pickle'.format(_cache_key(library_file, includes)))
+    modules = _module_files(includes)
+    # The schema tree is deeply nested, which the pickle module handles by recursion
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursion_limit, 20000))
+    try:
+        return _load(cache_file, modules, library_file, includes)
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+
+def _load(cache_file, modules, library_file, includes):
+    try:
+        with open(cache_file, 'rb') as f:
+            cached_modules, dm = pickle.load(f)
+        if cached_modules == modules:
+            return dm
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print("Ignoring unusable data model cache {}. Exception: {} - {}".format(cache_file, str(e), type(e)))
+    dm = yangson.DataModel.from_file(library_file, includes)
+    try:
+        _store(cache_file, (modules, dm))
+    except Exception as e:
+        print("Failed to cache the data model in {}. Exception: {} - {}".format(cache_file, str(e), type(e)))
+    return dm
+
+def _cache_key(library_file, includes):
+    h = hashlib.sha256()
+    with open(library_file, 'rb') as f:
+        h.update(f.read())
+    h.update(json.dumps([os.path.abspath(include) for include in includes]).encode())
+    # The pickled classes must match the yangson and Python versions loading them
+    h.update('yangson {} python {}'.format(version('yangson'), sys.version).encode())
+    return h.hexdigest()
+
+def _module_files(includes):
+    # Modification times of all modules yangson may resolve from the include paths
+    modules = dict()
+    for include in includes:
+        if not os.path.isdir(include):
+            continue
+        for name in os.listdir(include):
+            if name.endswith('.yang'):
+                path = os.path.join(include, name)
+                modules[path] = os.stat(path).st_mtime_ns
+    return modules
+
+def _store(cache_file, content):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(cache_file))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(content, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_name, cache_file)
+    except BaseException:
+        os.remove(tmp_name)
+        raise
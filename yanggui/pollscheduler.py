@@ -0,0 +1,75 @@
+# Copyright 2020-2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+import heapq
+import itertools
+import random
+import time
+
+class PollScheduler:
+    # Polls paths through the southbound interface, each at its own interval. The paths
+    # due at a tick are fetched with one batched GET. While a GET is still in flight, even
+    # one that timed out but still waits for the device, due paths are skipped until their
+    # next interval instead of piling up, and a random jitter of up to +-jitter * interval
+    # keeps paths from bunching up over time.
+    def __init__(self, southbound, dsrepo, default_interval=1.0, jitter=0.1):
+        self.southbound = southbound
+        self.dsrepo = dsrepo
+        self.default_interval = default_interval
+        self.jitter = jitter
+        self.intervals = dict() # path -> interval in s
+        self.queue = list()     # heap of (due time, sequence number, path)
+        self.queued = set()     # paths in the queue
+        self.sequence = itertools.count()
+        self.request = None
+        self.skipped = 0        # number of path polls skipped because of a request in flight
+
+    def add(self, path, interval=None, now=None):
+        if interval == None:
+            interval = self.default_interval
+        if interval <= 0:
+            raise ValueError('Polling interval must be positive: {}'.format(interval))
+        if now == None:
+            now = time.monotonic()
+        self.intervals[path] = interval
+        if not path in self.queued:
+            self.queued.add(path)
+            heapq.heappush(self.queue, (now, next(self.sequence), path))
+
+    def remove(self, path):
+        # The entry in the queue is dropped once it is due
+        self.intervals.pop(path, None)
+
+    def clear(self):
+        self.intervals = dict()
+        self.queue = list()
+        self.queued = set()
+
+    def is_polled(self, path):
+        return path in self.intervals
+
+    def poll(self, now=None):
+        # To be called periodically, e.g. by a timer with a resolution finer than the intervals
+        if now == None:
+            now = time.monotonic()
+        due = list()
+        while len(self.queue) > 0 and self.queue[0][0] <= now:
+            scheduled, seq, path = heapq.heappop(self.queue)
+            if not path in self.intervals:
+                self.queued.discard(path)
+                continue
+            due.append(path)
+            interval = self.intervals[path]
+            # Keep the phase of the path, unless it fell behind by more than an interval
+            next_time = scheduled + interval * (1 + random.uniform(-self.jitter, self.jitter))
+            if next_time <= now:
+                next_time = now + interval
+            heapq.heappush(self.queue, (next_time, next(self.sequence), path))
+        if len(due) == 0 or self.southbound == None:
+            return None
+        if self.request != None and self.request.in_flight():
+            self.skipped += len(due)
+            return None
+        self.request = self.southbound.get(self.dsrepo, due)
+        return due
@@ -0,0 +1,166 @@
+# Copyright 2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+import json
+import os
+import tempfile
+
+import numpy
+
+RECORDING_VERSION = 1
+
+class Recorder:
+    # Append-only recording of (timestamp, path id, value) samples. A recording is a
+    # directory with one memory-mapped file per column and an index holding the recorded
+    # paths and the number of valid records. The column files grow by chunk_size records
+    # at a time, samples appended after the last flush are lost if the process dies.
+    columns = {'times': numpy.float64, 'ids': numpy.uint32, 'values': numpy.float64}
+
+    def __init__(self, directory, readonly=False, chunk_size=1 << 16, flush_every=1 << 14):
+        self.directory = directory
+        self.readonly = readonly
+        self.chunk_size = chunk_size
+        self.flush_every = flush_every
+        self.paths = list()     # path of each path id
+        self.path_ids = dict()  # path -> path id
+        self.count = 0
+        self.sorted = True      # timestamps are in order, so time ranges can be bisected
+        self.unflushed = 0
+        if os.path.exists(self._index_file()):
+            self._load_index()
+        elif readonly:
+            raise FileNotFoundError('No recording in {}'.format(directory))
+        else:
+            os.makedirs(directory, exist_ok=True)
+            for name in self.columns:
+                open(self._column_file(name), 'wb').close()
+            self._store_index()
+        self._map()
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, path, value):
+        if self.count == self.capacity:
+            self._map(self.capacity + self.chunk_size)
+        if self.count > 0 and timestamp < self.times[self.count - 1]:
+            self.sorted = False
+        self.times[self.count] = timestamp
+        self.ids[self.count] = self.path_id(path)
+        self.values[self.count] = value
+        self.count += 1
+        self.unflushed += 1
+        if self.unflushed >= self.flush_every:
+            self.flush()
+
+    def path_id(self, path):
+        path_id = self.path_ids.get(path)
+        if path_id == None:
+            path_id = len(self.paths)
+            self.paths.append(path)
+            self.path_ids[path] = path_id
+        return path_id
+
+    def flush(self):
+        if self.readonly:
+            return
+        for name in self.columns:
+            getattr(self, name).flush()
+        self._store_index()
+        self.unflushed = 0
+
+    def close(self):
+        self.flush()
+        self.times = self.ids = self.values = None
+
+    def time_range(self):
+        if self.count == 0:
+            return None
+        times = self.times[:self.count]
+        if self.sorted:
+            return times[0], times[-1]
+        return times.min(), times.max()
+
+    def select(self, t_min=None, t_max=None):
+        # Times, path ids and values of the records with t_min <= time <= t_max. The arrays
+        # are views of the mapped files as long as the recording is in time order.
+        times = self.times[:self.count]
+        ids = self.ids[:self.count]
+        values = self.values[:self.count]
+        if not self.sorted:
+            mask = numpy.ones(self.count, dtype=bool)
+            if t_min != None:
+                mask &= times >= t_min
+            if t_max != None:
+                mask &= times <= t_max
+            return times[mask], ids[mask], values[mask]
+        first = 0 if t_min == None else numpy.searchsorted(times, t_min, side='left')
+        last = self.count if t_max == None else numpy.searchsorted(times, t_max, side='right')
+        return times[first:last], ids[first:last], values[first:last]
+
+    def series(self, path, t_min=None, t_max=None):
+        # Times and values recorded for one path, in recording order
+        times, ids, values = self.select(t_min, t_max)
+        path_id = self.path_ids.get(path)
+        if path_id == None:
+            return numpy.zeros(0), numpy.zeros(0)
+        mask = ids == path_id
+        return times[mask], values[mask]
+
+    def series_by_path(self, t_min=None, t_max=None):
+        # (path, times, values) of every recorded path, in recording order. The records are
+        # grouped with a single stable sort of the path ids.
+        times, ids, values = self.select(t_min, t_max)
+        order = numpy.argsort(ids, kind='stable')
+        bounds = numpy.searchsorted(ids[order], numpy.arange(len(self.paths) + 1), side='left')
+        for path_id, path in enumerate(self.paths):
+            records = order[bounds[path_id]:bounds[path_id + 1]]
+            yield path, times[records], values[records]
+
+    def _map(self, capacity=None):
+        if capacity == None:
+            capacity = max(self.count, self.chunk_size)
+        mode = 'r' if self.readonly else 'r+'
+        for name, dtype in self.columns.items():
+            file_name = self._column_file(name)
+            size = os.path.getsize(file_name) // numpy.dtype(dtype).itemsize
+            if not self.readonly and size < capacity:
+                # Views handed out earlier keep mapping the old, unchanged part of the file
+                with open(file_name, 'r+b') as f:
+                    f.truncate(capacity * numpy.dtype(dtype).itemsize)
+                size = capacity
+            if size < self.count:
+                raise ValueError('Recording {} is truncated: {} has {} of {} records'.format(self.directory, name, size, self.count))
+            if size == 0:
+                setattr(self, name, numpy.zeros(0, dtype=dtype))
+            else:
+                setattr(self, name, numpy.memmap(file_name, dtype=dtype, mode=mode, shape=(size, )))
+        self.capacity = len(self.times) if not self.readonly else self.count
+
+    def _load_index(self):
+        with open(self._index_file()) as f:
+            index = json.load(f)
+        if index['version'] != RECORDING_VERSION:
+            raise ValueError('Unsupported recording version {} in {}'.format(index['version'], self.directory))
+        self.count = index['count']
+        self.sorted = index['sorted']
+        for path in index['paths']:
+            self.path_id(tuple(path))
+
+    def _store_index(self):
+        index = {'version': RECORDING_VERSION, 'count': self.count, 'sorted': self.sorted, 'paths': self.paths}
+        fd, tmp_name = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp_name, self._index_file())
+        except BaseException:
+            os.remove(tmp_name)
+            raise
+
+    def _index_file(self):
+        return os.path.join(self.directory, 'index.json')
+
+    def _column_file(self, name):
+        return os.path.join(self.directory, '{}.bin'.format(name))
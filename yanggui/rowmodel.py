@@ -0,0 +1,61 @@
+# Copyright 2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+import collections
+
+import yangson
+
+class RowModel:
+    # Display strings of the entries of a list, one array per column. A cell is formatted
+    # when it is first shown and kept as long as its entry is unchanged. Instance values
+    # are persistent, so an entry that is still the same object needs no new strings, even
+    # when entries were inserted or deleted in front of it.
+    def __init__(self, columns, format):
+        self.columns = columns
+        self.format = format    # format(entry, column) -> display string, entry is an instance node
+        self.node = None        # instance node of the list
+        self.entries = list()   # entry values, for matching rows after a change
+        self.cells = [list() for column in columns]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def update(self, node):
+        # Returns False if the list is unchanged
+        value = node.value if node != None else None
+        if self.node != None and value is self.node.value:
+            self.node = node
+            return False
+        entries = list(value) if value != None else list()
+        rows = {id(entry): row for row, entry in enumerate(self.entries)}
+        cells = [[None] * len(entries) for column in self.columns]
+        for row, entry in enumerate(entries):
+            old_row = rows.get(id(entry))
+            if old_row != None:
+                for column in range(len(self.columns)):
+                    cells[column][row] = self.cells[column][old_row]
+        self.node = node
+        self.entries = entries
+        self.cells = cells
+        return True
+
+    def text(self, row, column):
+        text = self.cells[column][row]
+        if text == None:
+            text = self.format(self._entry(row), self.columns[column])
+            self.cells[column][row] = text
+        return text
+
+    def _entry(self, row):
+        # The entry without its siblings. Indexing the list node would copy all other entries
+        # into the siblings of the entry, and the formatting only reads the entry itself.
+        return yangson.instance.ArrayEntry(row, collections.deque(), collections.deque(), self.entries[row],
+                                           self.node, self.node.schema_node, self.node.value.timestamp)
+
+    def sample(self, count):
+        # Rows spread evenly over the list, e.g. to estimate the column widths
+        n = len(self.entries)
+        if n <= count:
+            return list(range(n))
+        return [idx * (n - 1) // (count - 1) for idx in range(count)]
@@ -4,7 +4,13 @@
 
 import yangson
 
+from . import dsrepo
+
 class SouthBoundIf:
+    # AsyncSouthBoundIf calls the interface from up to max_workers threads at once. Interfaces
+    # that are safe to be called concurrently, e.g. with a connection per thread, may raise it.
+    max_workers = 1
+
     def __init__(self):
         self.resources = list()
     
@@ -12,4 +18,22 @@ class SouthBoundIf:
         pass
         
     def get(self, dm, data, path) -> yangson.instance.InstanceNode: 
-        return None
\ No newline at end of file
+        return None
+
+    def put_many(self, dm, data, paths):
+        # data holds the instance node of each path. Interfaces able to write several
+        # resources in one request should override this.
+        for d, path in zip(data, paths):
+            self.put(dm, d, path)
+
+    def get_many(self, dm, data, paths) -> yangson.instance.InstanceNode:
+        # data is the root of the datastore, the result is a root with the retrieved data at all paths.
+        # Interfaces able to read several resources in one request should override this.
+        for path in paths:
+            d = dsrepo.resolve(data, path)
+            if d == None:
+                continue
+            d = self.get(dm, d, path)
+            if d != None:
+                data = d.top()
+        return data
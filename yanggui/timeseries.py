@@ -0,0 +1,150 @@
+# Copyright 2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+import numpy
+
+class RingBuffer:
+    # Time series of up to capacity samples. Every sample is stored twice, allocated capacity
+    # elements apart, so that the samples are always available as one contiguous, time ordered
+    # view without copying. The allocation starts small and doubles when it is full, so that
+    # a series only takes memory for the samples it holds.
+    def __init__(self, capacity, initial_capacity=1024):
+        self.capacity = capacity
+        self.allocated = min(capacity, initial_capacity)
+        self.times = numpy.zeros(2 * self.allocated)
+        self.values = numpy.zeros(2 * self.allocated)
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, time, value):
+        if self.size == self.allocated:
+            self._grow(self.size + 1)
+        idx = (self.start + self.size) % self.allocated
+        self.times[idx] = self.times[idx + self.allocated] = time
+        self.values[idx] = self.values[idx + self.allocated] = value
+        if self.size < self.allocated:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.allocated
+
+    def extend(self, times, values):
+        self._grow(self.size + len(times))
+        times = times[-self.allocated:]
+        values = values[-self.allocated:]
+        idx = (self.start + self.size + numpy.arange(len(times))) % self.allocated
+        self.times[idx] = self.times[idx + self.allocated] = times
+        self.values[idx] = self.values[idx + self.allocated] = values
+        overflow = max(0, self.size + len(times) - self.allocated)
+        self.size = min(self.allocated, self.size + len(times))
+        self.start = (self.start + overflow) % self.allocated
+
+    def discard(self, t_min):
+        # Drops the samples with time <= t_min
+        times = self.times[self.start:self.start + self.size]
+        count = int(numpy.searchsorted(times, t_min, side='right'))
+        self.start = (self.start + count) % self.allocated
+        self.size -= count
+
+    def _grow(self, size):
+        allocated = self.allocated
+        while allocated < min(size, self.capacity):
+            allocated = min(2 * allocated, self.capacity)
+        if allocated == self.allocated:
+            return
+        times = numpy.zeros(2 * allocated)
+        values = numpy.zeros(2 * allocated)
+        times[:self.size] = times[allocated:allocated + self.size] = self.times[self.start:self.start + self.size]
+        values[:self.size] = values[allocated:allocated + self.size] = self.values[self.start:self.start + self.size]
+        self.times = times
+        self.values = values
+        self.allocated = allocated
+        self.start = 0
+
+    def clear(self):
+        self.start = 0
+        self.size = 0
+
+    def last_time(self):
+        if self.size == 0:
+            return None
+        return self.times[self.start + self.size - 1]
+
+    def window(self, t_min, t_max=None, include_min=False):
+        # Views of the times and values of the samples with t_min < time <= t_max
+        times = self.times[self.start:self.start + self.size]
+        first = numpy.searchsorted(times, t_min, side='left' if include_min else 'right')
+        last = self.size if t_max == None else numpy.searchsorted(times, t_max, side='right')
+        return times[first:last], self.values[self.start + first:self.start + last]
+
+    def points(self, t_min, t_max=None):
+        # Samples as an N x 2 array, as taken by wx.lib.plot
+        times, values = self.window(t_min, t_max)
+        return numpy.column_stack((times, values))
+
+class MinMaxDownsampler:
+    # Reduces a series to the first minimum and maximum of each time bucket, e.g. one bucket
+    # per pixel, which keeps the visual extremes of the series. The buckets are aligned to
+    # multiples of the bucket width, so completed buckets stay valid while the plotted window
+    # moves and only the samples since the last completed bucket are processed on a redraw.
+    # The bucket at the start of the window is computed again when the start moves into it.
+    def __init__(self):
+        self.width = None
+        self.t_min = None
+        self.cache = numpy.zeros((0, 2))   # points of the completed buckets
+        self.done = -numpy.inf              # time of the first sample of the bucket not completed yet
+
+    def points(self, series, t_min, bucket_width):
+        if bucket_width != self.width:
+            self.width = bucket_width
+            self.cache = numpy.zeros((0, 2))
+            self.done = -numpy.inf
+        if t_min != self.t_min:
+            self.t_min = t_min
+            self._trim(series, t_min)
+        start = max(self.done, t_min)
+        times, values = series.window(start, include_min=(self.done > t_min))
+        if len(times) == 0:
+            return self.cache
+        idx, buckets = _minmax(times, values, bucket_width)
+        points = numpy.column_stack((times[idx], values[idx]))
+        # All but the last bucket are complete, as samples only arrive in time order
+        complete = (buckets[idx] < buckets[-1])
+        self.cache = numpy.concatenate((self.cache, points[complete]))
+        self.done = times[numpy.searchsorted(buckets, buckets[-1])]
+        return numpy.concatenate((self.cache, points[~complete]))
+
+    def _trim(self, series, t_min):
+        # Drops the points up to t_min. The samples of the bucket at t_min after it may have
+        # other extremes than the whole bucket, so its points are computed from them again.
+        self.cache = self.cache[numpy.searchsorted(self.cache[:, 0], t_min, side='right'):]
+        edge = numpy.floor(t_min / self.width)
+        if self.done == -numpy.inf or edge >= numpy.floor(self.done / self.width):
+            return # the bucket is not completed yet
+        kept = int(numpy.count_nonzero(numpy.floor(self.cache[:, 0] / self.width) == edge))
+        times, values = series.window(t_min, min(self.done, (edge + 1) * self.width))
+        in_edge = (numpy.floor(times / self.width) == edge)
+        times = times[in_edge]
+        values = values[in_edge]
+        if len(times) > 0:
+            idx, buckets = _minmax(times, values, self.width)
+            points = numpy.column_stack((times[idx], values[idx]))
+        else:
+            points = numpy.zeros((0, 2))
+        self.cache = numpy.concatenate((points, self.cache[kept:]))
+
+def _minmax(times, values, bucket_width):
+    # Indices of the first minimum and maximum of each bucket, and the bucket of each sample
+    buckets = numpy.floor(times / bucket_width).astype(numpy.int64)
+    starts = numpy.flatnonzero(numpy.concatenate(([True], buckets[1:] != buckets[:-1])))
+    segment = numpy.repeat(numpy.arange(len(starts)), numpy.diff(numpy.append(starts, len(values))))
+    indices = list()
+    for reduce in (numpy.minimum, numpy.maximum):
+        extreme = reduce.reduceat(values, starts)
+        candidates = numpy.flatnonzero(values == extreme[segment])
+        segments, first = numpy.unique(segment[candidates], return_index=True)
+        indices.append(candidates[first])
+    return numpy.unique(numpy.concatenate(indices)), buckets
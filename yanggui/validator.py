@@ -0,0 +1,253 @@
+# Copyright 2020-2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+from collections import deque
+
+import yangson
+
+class LazyArrayEntry(yangson.instance.ArrayEntry):
+    # A list entry whose sibling deques are only built when they are used. Walking a yangson
+    # array with next() or indexing it copies them for every entry, which takes time and
+    # memory proportional to the length of the list.
+    def __init__(self, key, array, parinst, schema_node, timestamp):
+        self._array = array
+        super().__init__(key, None, None, array[key], parinst, schema_node, timestamp)
+
+    @property
+    def before(self):
+        if self._before == None:
+            self._before = deque(reversed(self._array[:self.index]))
+        return self._before
+
+    @before.setter
+    def before(self, before):
+        self._before = before
+
+    @property
+    def after(self):
+        if self._after == None:
+            self._after = deque(self._array[self.index + 1:])
+        return self._after
+
+    @after.setter
+    def after(self, after):
+        self._after = after
+
+    def _zip(self):
+        if self._before == None and self._after == None:
+            return self._array
+        return super()._zip()
+
+def iter_children(node):
+    if isinstance(node.value, yangson.instvalue.ObjectValue):
+        for item in node:
+            yield node[item]
+    elif isinstance(node.value, yangson.instvalue.ArrayValue):
+        for idx in range(len(node.value)):
+            yield LazyArrayEntry(idx, node.value, node, node.schema_node, node.value.timestamp)
+
+class Validator:
+    def __init__(self):
+        self.scope = yangson.enumerations.ValidationScope.all
+        self.ctype = yangson.enumerations.ContentType.all
+        self._xpath_nodes = dict() # schema node -> (has must/when/leafref checks, subtree has them)
+        self._xpath_exprs = dict() # schema node with such checks -> its must and when expressions
+        self._dependencies = dict() # schema node -> nodes referred to by the expressions and by the leafref path
+        self._around = dict()      # schema node -> (names of the nodes in its subtree, names of its ancestors)
+
+    def validate(self, node, errors):
+        # Validate every node of the subtree exactly once, errors is an ErrorStore
+        self.validate_node(node, errors)
+        for child in iter_children(node):
+            self.validate(child, errors)
+
+    def validate_dependents(self, root, changed, errors, skip=(), indexed=()):
+        # Only validate the nodes whose must, when or leafref expressions may refer to the changed
+        # subtrees. The nodes in skip and in the changed subtrees are validated by the caller, as
+        # are the leafrefs in indexed, whose references to changed targets are looked up instead.
+        subtree = set()
+        ancestors = set()
+        for path in changed:
+            sn = _schema_node(root.schema_node, path)
+            if sn == None:
+                subtree = None
+                break
+            subtree |= self._names_around(sn)[0]
+            ancestors |= self._names_around(sn)[1]
+        names = (subtree, ancestors) if subtree != None else None
+        owners = set()
+        relevant = set()
+        self._xpath_flags(root.schema_node)
+        for sn in self._xpath_exprs:
+            if self._refers_to(sn, names, indexed):
+                owners.add(sn)
+                while sn != None and not sn in relevant:
+                    relevant.add(sn)
+                    sn = sn.parent
+        if len(owners) > 0:
+            self._validate_owners(root, owners, relevant, errors, skip, set(changed))
+
+    def _validate_owners(self, node, owners, relevant, errors, skip, changed):
+        if node.path in changed:
+            return
+        if node.schema_node in owners and not node.path in skip:
+            self.validate_node(node, errors)
+        for child in iter_children(node):
+            if child.schema_node in relevant:
+                self._validate_owners(child, owners, relevant, errors, skip, changed)
+
+    def validate_node(self, inst, errors):
+        e = self.check_node(inst)
+        if e == None:
+            errors.remove(inst.path)
+        else:
+            errors.insert(inst.path, e)
+
+    def check_node(self, inst):
+        # Run the checks of the node itself in the order of yangson's recursive validation,
+        # which stops at the first error of a node
+        sn = inst.schema_node
+        try:
+            if isinstance(sn, yangson.schemanode.SequenceNode) and not isinstance(inst, yangson.instance.ArrayEntry):
+                sn._check_list_props(inst)
+                sn._check_cardinality(inst)
+            else:
+                if isinstance(sn, yangson.schemanode.DataNode):
+                    sn._check_must(inst)
+                if isinstance(sn, yangson.schemanode.InternalNode):
+                    sn._check_schema_pattern(inst, self.ctype)
+                elif isinstance(sn, yangson.schemanode.TerminalNode):
+                    yangson.schemanode.TerminalNode._validate(sn, inst, self.scope, self.ctype)
+        except yangson.exceptions.YangsonException as e:
+            return e
+        return None
+
+    def _xpath_flags(self, sn):
+        if not sn in self._xpath_nodes:
+            exprs = [must.expression for must in getattr(sn, 'must', [])]
+            # The when of the node is evaluated by its parent and by its own schema pattern
+            if getattr(sn, 'when', None) != None:
+                exprs.append(sn.when)
+            subtree = False
+            if isinstance(sn, yangson.schemanode.InternalNode):
+                for child in sn.children:
+                    child_local, child_subtree = self._xpath_flags(child)
+                    if getattr(child, 'when', None) != None:
+                        exprs.append(child.when)
+                    if not isinstance(child, yangson.schemanode.DataNode): # choice and case are checked by the parent
+                        exprs.extend(self._xpath_exprs.get(child, []))
+                    subtree = subtree or child_subtree
+            local = len(exprs) > 0 or _is_link(sn)
+            if local:
+                self._xpath_exprs[sn] = exprs
+            self._xpath_nodes[sn] = (local, local or subtree)
+        return self._xpath_nodes[sn]
+
+    def _refers_to(self, sn, changed, indexed):
+        # changed holds the names of the changed nodes and their descendants, and of their ancestors
+        if changed == None:
+            return True
+        if not sn in self._dependencies:
+            self._dependencies[sn] = (_dependencies(self._xpath_exprs[sn]),
+                                      _dependencies([getattr(sn.type, 'path', None)] if _is_link(sn) else []))
+        exprs, link = self._dependencies[sn]
+        if _depends_on(exprs, changed):
+            return True
+        return not sn in indexed and _depends_on(link, changed)
+
+    def _names_around(self, sn):
+        # Names of the nodes in the subtree of sn and of its ancestors, whose values change with it
+        if not sn in self._around:
+            subtree = set()
+            _subtree_names(sn, subtree)
+            ancestors = set()
+            parent = sn.parent
+            while parent != None:
+                ancestors.add(parent.name)
+                parent = parent.parent
+            self._around[sn] = (subtree, ancestors)
+        return self._around[sn]
+
+def _dependencies(exprs):
+    # (names of referred nodes, names of nodes whose values are read), None if unknown
+    names = set()
+    values = set()
+    if not _references(exprs, names, values):
+        return None
+    return names, values
+
+def _depends_on(dependencies, changed):
+    if dependencies == None:
+        return True
+    names, values = dependencies
+    subtree, ancestors = changed
+    return not names.isdisjoint(subtree) or not values.isdisjoint(ancestors)
+
+def _is_link(sn):
+    return (isinstance(sn, yangson.schemanode.TerminalNode) and isinstance(sn.type, yangson.datatype.LinkType)
+            and sn.type.require_instance)
+
+def _schema_node(sn, path):
+    for key in path:
+        if not isinstance(key, int):
+            sn = sn.get_data_child(*sn._iname2qname(key))
+            if sn == None:
+                return None
+    return sn
+
+def _subtree_names(sn, names):
+    names.add(sn.name)
+    for child in getattr(sn, 'children', ()):
+        _subtree_names(child, names)
+
+def _references(exprs, names, values):
+    # Adds the names of the data nodes the expressions refer to, and of those whose values they
+    # read, and returns False if that is not known from the expressions alone, e.g. for deref(),
+    # wildcards or the descendant axis. Only the last step of a location path and the steps with
+    # predicates refer to nodes, the others just lead to them. The context node is left out, it
+    # only changes with its own subtree and is then validated as an ancestor of the change.
+    for expr in exprs:
+        if expr == None or isinstance(expr, yangson.xpathast.FuncDeref):
+            return False
+        if isinstance(expr, (yangson.xpathast.LocationPath, yangson.xpathast.Step, yangson.xpathast.Root)):
+            if not _path_references(expr, names, values, True):
+                return False
+        elif (isinstance(expr, (yangson.xpathast.FuncCount, yangson.xpathast.FuncNot, yangson.xpathast.FuncBoolean))
+                and isinstance(expr.expr, (yangson.xpathast.LocationPath, yangson.xpathast.Step))):
+            # Only whether the nodes exist
+            if not _path_references(expr.expr, names, values, False):
+                return False
+        else:
+            children = list()
+            for value in vars(expr).values():
+                if isinstance(value, yangson.xpathast.Expr):
+                    children.append(value)
+                elif isinstance(value, list):
+                    children.extend(v for v in value if isinstance(v, yangson.xpathast.Expr))
+            if not _references(children, names, values):
+                return False
+    return True
+
+def _path_references(expr, names, values, read):
+    steps = _steps(expr)
+    for step in steps:
+        if isinstance(step, yangson.xpathast.Root):
+            continue
+        if step.axis == yangson.xpathast.Axis.child and step.qname != False:
+            if len(step.predicates) > 0 or step is steps[-1]:
+                names.add(step.qname[0])
+            if len(step.predicates) > 0 or (read and step is steps[-1]):
+                values.add(step.qname[0])
+        elif step.axis != yangson.xpathast.Axis.parent and step.axis != yangson.xpathast.Axis.self:
+            return False
+        if not _references(step.predicates, names, values):
+            return False
+    last = steps[-1]
+    # A path ending at an ancestor refers to nodes that may be anywhere
+    return isinstance(last, yangson.xpathast.Step) and (last.axis == yangson.xpathast.Axis.child or len(steps) == 1)
+
+def _steps(expr):
+    if isinstance(expr, yangson.xpathast.LocationPath):
+        return _steps(expr.left) + _steps(expr.right)
+    return [expr]
@@ -0,0 +1,75 @@
+# Copyright 2020-2021, Christian Herber
+#
+# SPDX-License-Identifier: LGPL-3.0-or-later
+
+import queue
+import threading
+
+import wx
+
+class Task:
+    def __init__(self, worker, name, run, done, failed):
+        self.worker = worker
+        self.name = name
+        self.run = run
+        self.done = done
+        self.failed = failed
+        self.cancelled = threading.Event()
+
+    def progress(self, done, total):
+        # Called from the worker thread, returns False once the task has been cancelled
+        wx.CallAfter(self.worker._notify, 'progress', self, done, total)
+        return not self.cancelled.is_set()
+
+    def cancel(self):
+        self.cancelled.set()
+
+class Worker:
+    # Runs tasks one after the other on a background thread. A task is run as
+    # run(progress) and its result or exception is handed to done(result) or
+    # failed(exception) on the GUI thread through wx.CallAfter.
+    def __init__(self):
+        self.tasks = queue.Queue()
+        self.current = None
+        self.listeners = list()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def register_listener(self, listener):
+        # listener(event, task, done, total) with event in 'started', 'progress', 'finished'
+        self.listeners.append(listener)
+
+    def submit(self, name, run, done=None, failed=None):
+        task = Task(self, name, run, done, failed)
+        self.tasks.put(task)
+        return task
+
+    def cancel(self):
+        task = self.current
+        if task != None:
+            task.cancel()
+
+    def is_busy(self):
+        return self.current != None or not self.tasks.empty()
+
+    def _run(self):
+        while True:
+            task = self.tasks.get()
+            self.current = task
+            wx.CallAfter(self._notify, 'started', task, 0, 0)
+            try:
+                result = task.run(task.progress)
+            except Exception as e:
+                if task.failed != None:
+                    wx.CallAfter(task.failed, e)
+                else:
+                    wx.CallAfter(print, "{} failed: {} - {}".format(task.name, str(e), type(e)))
+            else:
+                if task.done != None:
+                    wx.CallAfter(task.done, result)
+            self.current = None
+            wx.CallAfter(self._notify, 'finished', task, 0, 0)
+
+    def _notify(self, event, task, done, total):
+        for listener in self.listeners:
+            listener(event, task, done, total)
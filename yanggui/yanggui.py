@@ -12,12 +12,15 @@ import yangson
 
 from importlib_metadata import version
 
-from pubsub import pub
-
+from .datafile import LoadCancelled
 from .dsrepo import DataStoreRepo
 from .errorlog import ErrorLog
 from .dataeditor import YangPropertyGrid
+from .coalescer import UpdateCoalescer
+from .asyncsouthbound import AsyncSouthBoundIf
 from .graphviewer import GraphViewer
+from .modelcache import load_data_model
+from .worker import Worker
 
 class MainFrame(wx.Frame):
     def __init__(self, southboundIf, title, icon):
@@ -30,6 +33,7 @@ class MainFrame(wx.Frame):
         self.Bind(wx.EVT_CLOSE, self._OnClose)
         self.graphViewer = None
         self.southboundIf = southboundIf
+        self.southbound = AsyncSouthBoundIf(southboundIf) if southboundIf != None else None
         self.splitter = wx.SplitterWindow(self, -1)
         self.splitter.SetMinimumPaneSize(20)
         self.dataEditorPanel = wx.Panel(self.splitter, -1)
@@ -47,7 +51,12 @@ class MainFrame(wx.Frame):
         self.utilsSizer.Add(self.utilsBook, 1, wx.EXPAND)
         
         self.dataEditor = None
+        self.dsrepo = None
+        self.coalescer = UpdateCoalescer(max_rate=10, windows=[self.dataEditorPanel])
         
+        self.worker = Worker()
+        self.worker.register_listener(self._OnWorkerEvent)
+
         self._InitUI()
 
         self.config = wx.FileConfig(appName=title)
@@ -63,12 +72,49 @@ class MainFrame(wx.Frame):
 
     def _OnClose(self, e):
         del self.config
+        if self.southbound != None:
+            self.southbound.shutdown()
+        if self.graphViewer != None:
+            self.graphViewer.stop_recording()
         e.Skip()
 
     def _InitUI(self):
         self.Maximize()
         self.menu = self.YangMenuBar(self)
         self.SetMenuBar(self.menu)
+        self._InitStatusBar()
+
+    def _InitStatusBar(self):
+        self.statusBar = self.CreateStatusBar(3)
+        self.statusBar.SetStatusWidths([-1, 200, 80])
+        self.gauge = wx.Gauge(self.statusBar, range=100)
+        self.cancelButton = wx.Button(self.statusBar, label='Cancel')
+        self.cancelButton.Bind(wx.EVT_BUTTON, self._OnCancelTask)
+        self.cancelButton.Hide()
+        self.statusBar.Bind(wx.EVT_SIZE, self._OnStatusBarSize)
+        self._OnStatusBarSize(None)
+
+    def _OnStatusBarSize(self, e):
+        self.gauge.SetRect(self.statusBar.GetFieldRect(1))
+        self.cancelButton.SetRect(self.statusBar.GetFieldRect(2))
+        if e != None:
+            e.Skip()
+
+    def _OnWorkerEvent(self, event, task, done, total):
+        if event == 'started':
+            self.statusBar.SetStatusText(task.name, 0)
+            self.gauge.Pulse()
+            self.cancelButton.Show()
+        elif event == 'progress':
+            if total > 0:
+                self.gauge.SetValue(int(100 * done / total))
+        elif not self.worker.is_busy():
+            self.statusBar.SetStatusText('', 0)
+            self.gauge.SetValue(0)
+            self.cancelButton.Hide()
+
+    def _OnCancelTask(self, e):
+        self.worker.cancel()
 
     class YangMenuBar(wx.MenuBar):
         def __init__(self, parent):
@@ -86,6 +132,21 @@ class MainFrame(wx.Frame):
                         }
                     }
                 },
+                '&Edit': {
+                    'menu' : wx.Menu(),
+                    'items': {
+                        'Undo\tCtrl+Z': {
+                            'bmp': wx.ArtProvider.GetBitmap(wx.ART_UNDO),
+                            'helpString': 'Undo the last change of the YANG instance data',
+                            'handler': self.parent._OnUndo
+                        },
+                        'Redo\tCtrl+Y': {
+                            'bmp': wx.ArtProvider.GetBitmap(wx.ART_REDO),
+                            'helpString': 'Redo the last undone change of the YANG instance data',
+                            'handler': self.parent._OnRedo
+                        }
+                    }
+                },
                 '&YANG': {
                     'menu' : wx.Menu(),
                     'items': {
@@ -121,6 +182,26 @@ class MainFrame(wx.Frame):
                         }
                     }
                 },
+                '&Graph': {
+                    'menu' : wx.Menu(),
+                    'items': {
+                        'Start Recording...': {
+                            'bmp': wx.ArtProvider.GetBitmap(wx.ART_NEW_DIR),
+                            'helpString': 'Record the samples of the graphed YANG data to a directory',
+                            'handler': self.parent._OnStartRecording
+                        },
+                        'Stop Recording': {
+                            'bmp': wx.ArtProvider.GetBitmap(wx.ART_CLOSE),
+                            'helpString': 'Stop recording the samples of the graphed YANG data',
+                            'handler': self.parent._OnStopRecording
+                        },
+                        'Load Recording...': {
+                            'bmp': wx.ArtProvider.GetBitmap(wx.ART_FOLDER_OPEN),
+                            'helpString': 'Load recorded samples into the graphs',
+                            'handler': self.parent._OnLoadRecording
+                        }
+                    }
+                },
                 '&Help': {
                     'menu' : wx.Menu(),
                     'items': {
@@ -174,47 +255,100 @@ class MainFrame(wx.Frame):
 
     def _LoadLibrary(self, libraryFile):
         try:
-            self.dm = yangson.DataModel.from_file(libraryFile, self.includes)
+            self.dm = load_data_model(libraryFile, self.includes, self._CacheDir())
             self.config.Write("YANG Library", libraryFile)
         except yangson.exceptions.YangsonException as e:
             self.dm = None
             print("Error while loading the YANG library. Exception: {} - {}".format(str(e), type(e)))
         else:
             print('Loaded Yang Library from {}'.format(libraryFile))
-            pub.unsubAll()
-            self.dsrepo = DataStoreRepo(self.dm)
+            self.dsrepo = DataStoreRepo(self.dm, self.worker, snapshot_dir=os.path.join(self._CacheDir(), 'snapshots'))
             if self.graphViewer == None:
-                self.graphViewer = GraphViewer(self.utilsBook, self.dsrepo, self.southboundIf)
+                self.graphViewer = GraphViewer(self.utilsBook, self.dsrepo, self.southbound, self.coalescer)
                 self.utilsBook.AddPage(self.graphViewer, 'YANG Data Graphs')
+                self.coalescer.add_window(self.graphViewer)
             else:
                 self.graphViewer.reset()
+                self.graphViewer.set_dsrepo(self.dsrepo)
             self._CreateDataEditor()
             self.dsrepo.load_raw({}) # Load empty data first, can be overwritten later through menu
             self.errorLog.SetDataStore(self.dsrepo)
             
+    def _CacheDir(self):
+        return os.path.join(wx.StandardPaths.Get().GetUserLocalDataDir(), 'cache')
+
     def _LoadData(self, dataFile):
-        try:
-            self.dsrepo.load(dataFile)
-        except:
-            print("Failed to load data from {}".format(dataFile))
-            self.dsrepo.load_raw({})
-        else:
+        # Edits made while the data is loaded in the background would be lost
+        self.dataEditorPanel.Disable()
+        def done():
+            self.dataEditorPanel.Enable()
             self.menu.itemSaveData.Enable()
+        def failed(e):
+            self.dataEditorPanel.Enable()
+            if isinstance(e, LoadCancelled):
+                print("Loading of data from {} cancelled".format(dataFile))
+            else:
+                print("Failed to load data from {}".format(dataFile))
+                self.dsrepo.load_raw({})
+        self.dsrepo.load(dataFile, done=done, failed=failed)
+
+    def _OnUndo(self, e):
+        if self.dsrepo != None:
+            self.dsrepo.undo()
+
+    def _OnRedo(self, e):
+        if self.dsrepo != None:
+            self.dsrepo.redo()
+
+    def _OnStartRecording(self, e):
+        if self.graphViewer == None:
+            return
+        dirDialog = wx.DirDialog(self, "Record to directory")
+        if dirDialog.ShowModal() == wx.ID_OK:
+            try:
+                self.graphViewer.start_recording(dirDialog.GetPath())
+            except (OSError, ValueError) as e:
+                print("Failed to start recording to {}. Exception: {} - {}".format(dirDialog.GetPath(), str(e), type(e)))
+        dirDialog.Destroy()
+
+    def _OnStopRecording(self, e):
+        if self.graphViewer != None:
+            self.graphViewer.stop_recording()
+
+    def _OnLoadRecording(self, e):
+        if self.graphViewer == None:
+            return
+        dirDialog = wx.DirDialog(self, "Load recording", style=wx.DD_DIR_MUST_EXIST)
+        if dirDialog.ShowModal() == wx.ID_OK:
+            try:
+                self.graphViewer.load_recording(dirDialog.GetPath())
+            except (OSError, ValueError) as e:
+                print("Failed to load recording from {}. Exception: {} - {}".format(dirDialog.GetPath(), str(e), type(e)))
+        dirDialog.Destroy()
 
     def _OnDiffData(self, e):
-        diff = self.dsrepo.diff()
+        self.dsrepo.diff(done=self._ShowDiff)
 
+    def _ShowDiff(self, diff):
         dv = DiffViewer()
         dv.browser.SetPage(diff, 'diff')
         dv.Show()
 
+    def _SaveData(self, dataFile):
+        def failed(e):
+            print("Failed to save data to {}. Exception: {} - {}".format(dataFile, str(e), type(e)))
+        self.dsrepo.save(dataFile, failed=failed)
+
     def _CreateDataEditor(self):
         if self.dataEditor != None:
+            self.coalescer.clear() # pending updates of the destroyed properties
             self.dataEditorPanel.DestroyChildren()
         env = {
             'dsrepo': self.dsrepo,
             'southboundIf': self.southboundIf,
-            'graphViewer': self.graphViewer
+            'southbound': self.southbound,
+            'graphViewer': self.graphViewer,
+            'coalescer': self.coalescer
         }
         self.dataEditor = YangPropertyGrid(self.dm.schema, self.dataEditorPanel, env)
         self.graphViewer.set_editor(self.dataEditor)
@@ -233,7 +367,7 @@ class MainFrame(wx.Frame):
 
     def _OnSaveData(self, e):
         dataFile = self.config.Read("YANG Data Instance")
-        self.dsrepo.save(dataFile)
+        self._SaveData(dataFile)
 
     def _OnSaveDataAs(self, e):
         dataFile = self.config.Read("YANG Data Instance")
@@ -247,7 +381,7 @@ class MainFrame(wx.Frame):
         dataFile = fileDialog.GetPath()
         if dataFile != '':
             self.config.Write("YANG Data Instance", dataFile)
-            self.dsrepo.save(dataFile)
+            self._SaveData(dataFile)
             self.menu.itemSaveData.Enable()            
         fileDialog.Destroy()
         frame.Destroy()